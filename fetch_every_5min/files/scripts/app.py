@@ -2,21 +2,33 @@
 import json
 import os
 import csv
+import hashlib
+import time
 from datetime import datetime, timezone
 from pathlib import Path
 import sys
 
+import requests
 from simple_salesforce import (
     Salesforce,
     SalesforceMalformedRequest,
     SalesforceAuthenticationFailed,
+    SalesforceGeneralError,
 )
 
+from compression import compressed_path, open_input, open_output, remove_stale_variants, retry_call, write_json_atomic
+
 # ---------- Constants / Paths ----------
 BASE_DIR = Path(__file__).resolve().parent            # .../files/scripts
 FILES_DIR = BASE_DIR.parent                           # .../files
 OUT_DIR = FILES_DIR / "pricebook"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
+STATE_DIR = Path(os.environ.get("APP_STATE_DIR", str(FILES_DIR / "state")))
+STATE_DIR.mkdir(parents=True, exist_ok=True)
+
+CHECKPOINT_PATH = STATE_DIR / "app_checkpoint.json"
+SPOOL_PATH = STATE_DIR / "app_entries.spool.jsonl"
+METADATA_CACHE_PATH = STATE_DIR / "app_metadata_cache.json"
 
 # ---------- Config from ENV ----------
 SF_USERNAME = os.environ.get("SF_USERNAME", "")
@@ -34,6 +46,15 @@ PRICEBOOK2_ID = (os.environ.get("PRICEBOOK2_ID") or "").strip() or None
 # Include Product2 custom fields discovery?
 INCLUDE_PRODUCT2_CUSTOM_FIELDS = (os.environ.get("INCLUDE_PRODUCT2_FIELDS", "true").lower() in ("1","true","yes","y"))
 
+# Resume an interrupted export from the last completed page
+CHECKPOINT_ENABLED = (os.environ.get("APP_CHECKPOINT", "true").lower() in ("1","true","yes","y"))
+CHECKPOINT_MAX_AGE_SECONDS = int(os.environ.get("APP_CHECKPOINT_MAX_AGE_SECONDS", "3600"))
+
+# Daily API usage throttle (percent of the org limit, from Sforce-Limit-Info)
+SF_API_SLOWDOWN_PCT = float(os.environ.get("SF_API_SLOWDOWN_PCT", "80"))
+SF_API_CEILING_PCT = float(os.environ.get("SF_API_CEILING_PCT", "90"))
+SF_API_SLOWDOWN_SECONDS = float(os.environ.get("SF_API_SLOWDOWN_SECONDS", "2"))
+
 def header(title: str):
     print("\n" + "=" * 170)
     print(title)
@@ -54,8 +75,57 @@ def require_env():
     if missing:
         raise RuntimeError(f"Missing required environment variables: {', '.join(missing)}")
 
-def discover_custom_fields(sf, sobject_name):
-    desc = getattr(sf, sobject_name).describe()
+def _is_transient(exc) -> bool:
+    if isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(exc, SalesforceGeneralError):
+        return getattr(exc, "status", 0) >= 500
+    return False
+
+def call_with_retry(fn, *args, label="call", **kwargs):
+    """Call fn, retrying transient failures (SF_RETRY_* settings, see compression.retry_call)."""
+    return retry_call(fn, *args, label=label, transient=_is_transient, **kwargs)
+
+class ApiThrottle:
+    """Tracks daily API usage reported in the Sforce-Limit-Info header."""
+
+    def __init__(self, slowdown_pct: float, ceiling_pct: float, slowdown_seconds: float):
+        self.slowdown_pct = slowdown_pct
+        self.ceiling_pct = ceiling_pct
+        self.slowdown_seconds = slowdown_seconds
+        self.used = None
+        self.total = None
+
+    def observe(self, *sources):
+        for src in sources:
+            usage = (getattr(src, "api_usage", None) or {}).get("api-usage")
+            if usage is not None and usage.total:
+                self.used, self.total = usage.used, usage.total
+
+    def usage_pct(self):
+        if not self.total:
+            return None
+        return 100.0 * self.used / self.total
+
+    def summary(self) -> str:
+        pct = self.usage_pct()
+        if pct is None:
+            return "unknown"
+        return f"{self.used}/{self.total} ({pct:.1f}%)"
+
+    def should_defer(self) -> bool:
+        pct = self.usage_pct()
+        return pct is not None and pct >= self.ceiling_pct
+
+    def pace(self):
+        pct = self.usage_pct()
+        if pct is not None and pct >= self.slowdown_pct:
+            time.sleep(self.slowdown_seconds)
+
+def discover_custom_fields(sf, sobject_name, throttle):
+    sobject = getattr(sf, sobject_name)
+    desc = call_with_retry(sobject.describe, label=f"{sobject_name}.describe")
+    throttle.observe(sobject)
     fields = []
     for f in desc.get("fields", []):
         name = f.get("name")
@@ -75,7 +145,7 @@ def build_all_pricebooks_soql():
     ]
     return f"SELECT {', '.join(fields)} FROM Pricebook2"
 
-def build_flat_pbe_soql(include_currency_iso, pbe_custom_fields, product2_custom_fields, pricebook2_id=None):
+def build_flat_pbe_soql(include_currency_iso, pbe_custom_fields, product2_custom_fields, pricebook2_id=None, after_id=None):
     fields = [
         "Id","Pricebook2Id","Product2Id","UnitPrice","IsActive","UseStandardPrice","CreatedDate","LastModifiedDate",
         "Pricebook2.Id","Pricebook2.Name","Pricebook2.IsActive","Pricebook2.IsStandard","Pricebook2.Description",
@@ -90,13 +160,19 @@ def build_flat_pbe_soql(include_currency_iso, pbe_custom_fields, product2_custom
         fields.extend([f"Product2.{f}" for f in product2_custom_fields])
 
     soql = f"SELECT {', '.join(fields)} FROM PricebookEntry"
+    where = []
     if pricebook2_id:
-        soql += f" WHERE Pricebook2Id = '{pricebook2_id}'"
-    return soql
+        where.append(f"Pricebook2Id = '{pricebook2_id}'")
+    if after_id:
+        where.append(f"Id > '{after_id}'")
+    if where:
+        soql += " WHERE " + " AND ".join(where)
+    # Stable Id order lets an interrupted export resume after the last Id
+    return soql + " ORDER BY Id"
 
 def detect_multi_currency(sf) -> bool:
     try:
-        sf.query("SELECT Id, CurrencyIsoCode FROM PricebookEntry LIMIT 1")
+        call_with_retry(sf.query, "SELECT Id, CurrencyIsoCode FROM PricebookEntry LIMIT 1", label="currency probe")
         return True
     except SalesforceMalformedRequest as e:
         msg = str(e)
@@ -110,11 +186,13 @@ def login_salesforce():
     info(f"Domain   : {SF_DOMAIN}")
     require_env()
     try:
-        sf = Salesforce(
+        sf = call_with_retry(
+            Salesforce,
             username=SF_USERNAME,
             password=SF_PASSWORD,
             security_token=SF_SECURITY_TOKEN,
             domain=SF_DOMAIN,
+            label="login",
         )
         info("Logged in (user+pass+token)")
         return sf
@@ -128,29 +206,123 @@ def safe_rel(dct, rel_name, key, default=None):
         return rel.get(key, default)
     return default
 
-def main():
-    sf = login_salesforce()
+# ---------- Checkpoint / metadata cache ----------
+def _read_json(path: Path):
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+def export_fingerprint(soql: str, header_cols, out_csv: Path) -> str:
+    # The header matters too: it follows INCLUDE_PRODUCT2_FIELDS, the SOQL
+    # built from checkpointed metadata does not
+    return hashlib.sha1(f"{soql}\n{','.join(header_cols)}\n{out_csv}".encode("utf-8")).hexdigest()
+
+def clear_checkpoint():
+    for p in (CHECKPOINT_PATH, SPOOL_PATH):
+        p.unlink(missing_ok=True)
+
+def load_checkpoint():
+    if not CHECKPOINT_ENABLED:
+        return None
+    ckpt = _read_json(CHECKPOINT_PATH)
+    if not ckpt:
+        return None
+    age = time.time() - ckpt.get("updated_ts", 0)
+    if age > CHECKPOINT_MAX_AGE_SECONDS:
+        info(f"Discarding stale checkpoint ({age:.0f}s old)")
+        clear_checkpoint()
+        return None
+    return ckpt
+
+def save_checkpoint(ckpt):
+    if not CHECKPOINT_ENABLED:
+        return
+    ckpt["updated_ts"] = time.time()
+    write_json_atomic(CHECKPOINT_PATH, ckpt, ensure_ascii=False)
+
+def checkpoint_files_intact(ckpt, part_csv: Path, part_tsv: Path) -> bool:
+    try:
+        return (part_csv.stat().st_size >= ckpt["csv_bytes"]
+                and part_tsv.stat().st_size >= ckpt["tsv_bytes"]
+                and SPOOL_PATH.stat().st_size >= ckpt["spool_bytes"])
+    except (OSError, KeyError):
+        return False
+
+def iter_query_pages(sf, soql, throttle):
+    """Yield one list of records per REST query page, retrying each call."""
+    result = call_with_retry(sf.query, soql, label="query")
+    while True:
+        throttle.observe(sf)
+        yield result.get("records", [])
+        next_url = result.get("nextRecordsUrl")
+        if result.get("done", True) or not next_url:
+            return
+        result = call_with_retry(sf.query_more, next_url, identifier_is_url=True, label="query_more")
+
+def add_entry(pricebooks_map, pb_stub, entry):
+    pb_id = pb_stub["Id"]
+    if pb_id not in pricebooks_map:
+        pricebooks_map[pb_id] = dict(pb_stub, Entries=[])
+    pricebooks_map[pb_id]["Entries"].append(entry)
+
+def load_metadata(sf, throttle):
+    """(pbe_custom_fields, product2_custom_fields, include_currency), from the
+    cache when API usage is at the ceiling, else discovered and cached."""
+    cached_meta = _read_json(METADATA_CACHE_PATH) if throttle.should_defer() else None
+    if cached_meta:
+        header("DISCOVER METADATA (DEFERRED)")
+        info(f"API usage at/above {SF_API_CEILING_PCT:.0f}% ceiling; using metadata cached {cached_meta.get('cached_at')}")
+        product2_custom_fields = cached_meta["product2_custom_fields"] if INCLUDE_PRODUCT2_CUSTOM_FIELDS else []
+        return cached_meta["pbe_custom_fields"], product2_custom_fields, cached_meta["include_currency"]
 
     header("DISCOVER METADATA")
     info("Discovering custom fields on PricebookEntry…")
-    pbe_custom_fields = discover_custom_fields(sf, "PricebookEntry")
+    pbe_custom_fields = discover_custom_fields(sf, "PricebookEntry", throttle)
     info(f"PBE custom fields: {len(pbe_custom_fields)}")
 
     product2_custom_fields = []
     if INCLUDE_PRODUCT2_CUSTOM_FIELDS:
         info("Discovering custom fields on Product2…")
-        product2_custom_fields = discover_custom_fields(sf, "Product2")
+        product2_custom_fields = discover_custom_fields(sf, "Product2", throttle)
         info(f"Product2 custom fields: {len(product2_custom_fields)}")
 
     header("DETECT MULTI-CURRENCY")
     include_currency = detect_multi_currency(sf)
+    throttle.observe(sf)
     info(f"Multi-currency available: {include_currency}")
 
+    write_json_atomic(METADATA_CACHE_PATH, {
+        "cached_at": datetime.now(timezone.utc).isoformat(),
+        "pbe_custom_fields": pbe_custom_fields,
+        "product2_custom_fields": product2_custom_fields,
+        "include_currency": include_currency,
+    }, ensure_ascii=False)
+    return pbe_custom_fields, product2_custom_fields, include_currency
+
+def build_header_cols(include_currency, pbe_custom_fields, product2_custom_fields):
+    base_cols = [
+        "Pricebook.Id","Pricebook.Name","Entry.Id","Entry.Pricebook2Id","Entry.Product2Id",
+        "Entry.UnitPrice","Entry.IsActive","Entry.UseStandardPrice","Entry.CreatedDate","Entry.LastModifiedDate",
+        "Product.Id","Product.Name","Product.ProductCode","Product.Family","Product.IsActive","Product.Description",
+    ]
+    if include_currency:
+        base_cols.insert(7, "Entry.CurrencyIsoCode")
+
+    dynamic_cols = [f"Entry.{f}" for f in pbe_custom_fields]
+    if INCLUDE_PRODUCT2_CUSTOM_FIELDS:
+        dynamic_cols += [f"Product.{f}" for f in product2_custom_fields]
+    return base_cols + dynamic_cols
+
+def main():
+    sf = login_salesforce()
+    throttle = ApiThrottle(SF_API_SLOWDOWN_PCT, SF_API_CEILING_PCT, SF_API_SLOWDOWN_SECONDS)
+
     # Preload all pricebooks (even empty)
     header("QUERY PRICEBOOKS")
     pb_soql = build_all_pricebooks_soql()
     pricebooks_map = {}
-    for pb in sf.query_all_iter(pb_soql):
+    for pb in call_with_retry(sf.query_all, pb_soql, label="pricebooks query").get("records", []):
         pricebooks_map[pb["Id"]] = {
             "Id": pb["Id"],
             "Name": pb.get("Name"),
@@ -161,31 +333,82 @@ def main():
             "LastModifiedDate": pb.get("LastModifiedDate"),
             "Entries": [],
         }
+    throttle.observe(sf)
     info(f"Visible pricebooks fetched: {len(pricebooks_map)}")
+    info(f"API usage: {throttle.summary()}")
+
+    # Compressed outputs (OUTPUT_COMPRESSION) get a .gz/.zst suffix
+    out_json = compressed_path(OUT_DIR / OUTPUT_JSON_NAME)
+    out_csv = compressed_path(OUT_DIR / OUTPUT_CSV_NAME)
+    tsv_path = compressed_path((OUT_DIR / OUTPUT_CSV_NAME).with_suffix(".tsv"))
+    part_csv = out_csv.with_name(out_csv.name + ".part")
+    part_tsv = tsv_path.with_name(tsv_path.name + ".part")
+
+    ckpt = load_checkpoint()
+    if ckpt:
+        header("RESUME FROM CHECKPOINT")
+        pbe_custom_fields = ckpt["pbe_custom_fields"]
+        product2_custom_fields = ckpt["product2_custom_fields"]
+        include_currency = ckpt["include_currency"]
+        info(f"Reusing metadata from checkpoint started {ckpt.get('started_at')}")
+        header_cols = build_header_cols(include_currency, pbe_custom_fields, product2_custom_fields)
+        fingerprint = export_fingerprint(
+            build_flat_pbe_soql(include_currency, pbe_custom_fields, product2_custom_fields, PRICEBOOK2_ID),
+            header_cols, out_csv,
+        )
+        if ckpt.get("fingerprint") != fingerprint or not checkpoint_files_intact(ckpt, part_csv, part_tsv):
+            info("Checkpoint does not match this export; starting over")
+            clear_checkpoint()
+            ckpt = None
+
+    if not ckpt:
+        pbe_custom_fields, product2_custom_fields, include_currency = load_metadata(sf, throttle)
+        header_cols = build_header_cols(include_currency, pbe_custom_fields, product2_custom_fields)
+        fingerprint = export_fingerprint(
+            build_flat_pbe_soql(include_currency, pbe_custom_fields, product2_custom_fields, PRICEBOOK2_ID),
+            header_cols, out_csv,
+        )
+
+    resuming = ckpt is not None
+    total_entry_rows = 0
+    if resuming:
+        # Drop anything written after the last completed page
+        os.truncate(part_csv, ckpt["csv_bytes"])
+        os.truncate(part_tsv, ckpt["tsv_bytes"])
+        os.truncate(SPOOL_PATH, ckpt["spool_bytes"])
+        with open(SPOOL_PATH, "r", encoding="utf-8") as fspool:
+            for line in fspool:
+                item = json.loads(line)
+                add_entry(pricebooks_map, item["pb"], item["entry"])
+        total_entry_rows = ckpt["rows"]
+        info(f"Resuming after Id {ckpt['last_id']} ({total_entry_rows} rows, {ckpt['pages']} pages done)")
+    else:
+        clear_checkpoint()
+        ckpt = {
+            "fingerprint": fingerprint,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "pbe_custom_fields": pbe_custom_fields,
+            "product2_custom_fields": product2_custom_fields,
+            "include_currency": include_currency,
+            "last_id": None,
+            "pages": 0,
+            "rows": 0,
+            "csv_bytes": 0,
+            "tsv_bytes": 0,
+            "spool_bytes": 0,
+        }
 
     # Stream all entries
-    pbe_soql = build_flat_pbe_soql(include_currency, pbe_custom_fields, product2_custom_fields, PRICEBOOK2_ID)
-    header("QUERY PRICEBOOK ENTRIES (REST query_all_iter)")
+    pbe_soql = build_flat_pbe_soql(
+        include_currency, pbe_custom_fields, product2_custom_fields, PRICEBOOK2_ID, after_id=ckpt["last_id"],
+    )
+    header("QUERY PRICEBOOK ENTRIES (REST query/queryMore)")
     info("Streaming records…")
 
-    base_cols = [
-        "Pricebook.Id","Pricebook.Name","Entry.Id","Entry.Pricebook2Id","Entry.Product2Id",
-        "Entry.UnitPrice","Entry.IsActive","Entry.UseStandardPrice","Entry.CreatedDate","Entry.LastModifiedDate",
-        "Product.Id","Product.Name","Product.ProductCode","Product.Family","Product.IsActive","Product.Description",
-    ]
-    if include_currency:
-        base_cols.insert(7, "Entry.CurrencyIsoCode")
-
-    dynamic_cols = [f"Entry.{f}" for f in pbe_custom_fields]
-    if INCLUDE_PRODUCT2_CUSTOM_FIELDS:
-        dynamic_cols += [f"Product.{f}" for f in product2_custom_fields]
-    header_cols = base_cols + dynamic_cols
-
-    out_json = OUT_DIR / OUTPUT_JSON_NAME
-    out_csv = OUT_DIR / OUTPUT_CSV_NAME
-
-    total_entry_rows = 0
-    with open(out_csv, "w", encoding="utf-8-sig", newline="") as fcsv:
+    mode = "a" if resuming else "w"
+    with open_output(part_csv, mode, encoding="utf-8-sig", newline="") as fcsv, \
+         open_output(part_tsv, mode, encoding="utf-8-sig", newline="") as ftsv, \
+         open(SPOOL_PATH, mode, encoding="utf-8", newline="\n") as fspool:
         writer = csv.DictWriter(
             fcsv,
             fieldnames=header_cols,
@@ -194,17 +417,27 @@ def main():
             escapechar="\\",
             lineterminator="\n",
         )
-        writer.writeheader()
+        # TSV is written alongside the CSV in the same pass
+        tsv_writer = csv.DictWriter(
+            ftsv,
+            fieldnames=header_cols,
+            extrasaction="ignore",
+            delimiter="\t",
+            lineterminator="\n",
+        )
+        if not resuming:
+            writer.writeheader()
+            tsv_writer.writeheader()
 
         try:
-            for r in sf.query_all_iter(pbe_soql):
-                total_entry_rows += 1
+            for records in iter_query_pages(sf, pbe_soql, throttle):
+                for r in records:
+                    total_entry_rows += 1
 
-                pb_id = safe_rel(r, "Pricebook2", "Id") or r.get("Pricebook2Id")
-                pb_name = safe_rel(r, "Pricebook2", "Name")
+                    pb_id = safe_rel(r, "Pricebook2", "Id") or r.get("Pricebook2Id")
+                    pb_name = safe_rel(r, "Pricebook2", "Name")
 
-                if pb_id not in pricebooks_map:
-                    pricebooks_map[pb_id] = {
+                    pb_stub = {
                         "Id": pb_id,
                         "Name": pb_name,
                         "IsActive": safe_rel(r, "Pricebook2", "IsActive"),
@@ -212,88 +445,100 @@ def main():
                         "Description": safe_rel(r, "Pricebook2", "Description"),
                         "CreatedDate": safe_rel(r, "Pricebook2", "CreatedDate"),
                         "LastModifiedDate": safe_rel(r, "Pricebook2", "LastModifiedDate"),
-                        "Entries": [],
                     }
 
-                entry = {
-                    "Id": r.get("Id"),
-                    "Pricebook2Id": r.get("Pricebook2Id"),
-                    "Product2Id": r.get("Product2Id"),
-                    "UnitPrice": r.get("UnitPrice"),
-                    "IsActive": r.get("IsActive"),
-                    "UseStandardPrice": r.get("UseStandardPrice"),
-                    "CreatedDate": r.get("CreatedDate"),
-                    "LastModifiedDate": r.get("LastModifiedDate"),
-                    "Product": {
-                        "Id": r.get("Product2Id"),
-                        "Name": safe_rel(r, "Product2", "Name"),
-                        "ProductCode": safe_rel(r, "Product2", "ProductCode"),
-                        "Family": safe_rel(r, "Product2", "Family"),
-                        "IsActive": safe_rel(r, "Product2", "IsActive"),
-                        "Description": safe_rel(r, "Product2", "Description"),
-                    },
-                }
-                if include_currency:
-                    entry["CurrencyIsoCode"] = r.get("CurrencyIsoCode")
-
-                # Custom fields
-                for fcf in pbe_custom_fields:
-                    entry[fcf] = r.get(fcf)
-                if INCLUDE_PRODUCT2_CUSTOM_FIELDS:
-                    for fcf in product2_custom_fields:
-                        entry["Product"][fcf] = safe_rel(r, "Product2", fcf)
-
-                pricebooks_map[pb_id]["Entries"].append(entry)
-
-                # CSV row
-                row = {
-                    "Pricebook.Id": pb_id,
-                    "Pricebook.Name": pb_name,
-                    "Entry.Id": entry["Id"],
-                    "Entry.Pricebook2Id": entry["Pricebook2Id"],
-                    "Entry.Product2Id": entry["Product2Id"],
-                    "Entry.UnitPrice": entry["UnitPrice"],
-                    "Entry.IsActive": entry["IsActive"],
-                    "Entry.UseStandardPrice": entry["UseStandardPrice"],
-                    "Entry.CreatedDate": entry["CreatedDate"],
-                    "Entry.LastModifiedDate": entry["LastModifiedDate"],
-                    "Product.Id": entry["Product"]["Id"],
-                    "Product.Name": entry["Product"]["Name"],
-                    "Product.ProductCode": entry["Product"]["ProductCode"],
-                    "Product.Family": entry["Product"]["Family"],
-                    "Product.IsActive": entry["Product"]["IsActive"],
-                    "Product.Description": entry["Product"]["Description"],
-                }
-                if include_currency:
-                    row["Entry.CurrencyIsoCode"] = entry.get("CurrencyIsoCode")
-
-                for fcf in pbe_custom_fields:
-                    row[f"Entry.{fcf}"] = entry.get(fcf)
-                if INCLUDE_PRODUCT2_CUSTOM_FIELDS:
-                    for fcf in product2_custom_fields:
-                        row[f"Product.{fcf}"] = entry["Product"].get(fcf)
-
-                writer.writerow(row)
+                    entry = {
+                        "Id": r.get("Id"),
+                        "Pricebook2Id": r.get("Pricebook2Id"),
+                        "Product2Id": r.get("Product2Id"),
+                        "UnitPrice": r.get("UnitPrice"),
+                        "IsActive": r.get("IsActive"),
+                        "UseStandardPrice": r.get("UseStandardPrice"),
+                        "CreatedDate": r.get("CreatedDate"),
+                        "LastModifiedDate": r.get("LastModifiedDate"),
+                        "Product": {
+                            "Id": r.get("Product2Id"),
+                            "Name": safe_rel(r, "Product2", "Name"),
+                            "ProductCode": safe_rel(r, "Product2", "ProductCode"),
+                            "Family": safe_rel(r, "Product2", "Family"),
+                            "IsActive": safe_rel(r, "Product2", "IsActive"),
+                            "Description": safe_rel(r, "Product2", "Description"),
+                        },
+                    }
+                    if include_currency:
+                        entry["CurrencyIsoCode"] = r.get("CurrencyIsoCode")
+
+                    # Custom fields
+                    for fcf in pbe_custom_fields:
+                        entry[fcf] = r.get(fcf)
+                    if INCLUDE_PRODUCT2_CUSTOM_FIELDS:
+                        for fcf in product2_custom_fields:
+                            entry["Product"][fcf] = safe_rel(r, "Product2", fcf)
+
+                    add_entry(pricebooks_map, pb_stub, entry)
+                    fspool.write(json.dumps({"pb": pb_stub, "entry": entry}, ensure_ascii=False) + "\n")
+
+                    # CSV row
+                    row = {
+                        "Pricebook.Id": pb_id,
+                        "Pricebook.Name": pb_name,
+                        "Entry.Id": entry["Id"],
+                        "Entry.Pricebook2Id": entry["Pricebook2Id"],
+                        "Entry.Product2Id": entry["Product2Id"],
+                        "Entry.UnitPrice": entry["UnitPrice"],
+                        "Entry.IsActive": entry["IsActive"],
+                        "Entry.UseStandardPrice": entry["UseStandardPrice"],
+                        "Entry.CreatedDate": entry["CreatedDate"],
+                        "Entry.LastModifiedDate": entry["LastModifiedDate"],
+                        "Product.Id": entry["Product"]["Id"],
+                        "Product.Name": entry["Product"]["Name"],
+                        "Product.ProductCode": entry["Product"]["ProductCode"],
+                        "Product.Family": entry["Product"]["Family"],
+                        "Product.IsActive": entry["Product"]["IsActive"],
+                        "Product.Description": entry["Product"]["Description"],
+                    }
+                    if include_currency:
+                        row["Entry.CurrencyIsoCode"] = entry.get("CurrencyIsoCode")
+
+                    for fcf in pbe_custom_fields:
+                        row[f"Entry.{fcf}"] = entry.get(fcf)
+                    if INCLUDE_PRODUCT2_CUSTOM_FIELDS:
+                        for fcf in product2_custom_fields:
+                            row[f"Product.{fcf}"] = entry["Product"].get(fcf)
+
+                    writer.writerow(row)
+                    tsv_writer.writerow(row)
+
+                if records:
+                    fcsv.flush()
+                    ftsv.flush()
+                    fspool.flush()
+                    ckpt["last_id"] = records[-1]["Id"]
+                    ckpt["pages"] += 1
+                    ckpt["rows"] = total_entry_rows
+                    ckpt["csv_bytes"] = fcsv.buffer.tell()
+                    ckpt["tsv_bytes"] = ftsv.buffer.tell()
+                    ckpt["spool_bytes"] = fspool.buffer.tell()
+                    save_checkpoint(ckpt)
+                throttle.pace()
 
         except SalesforceMalformedRequest as e:
             print("\n! REST query failed while streaming.")
             print(f"  {e}")
+            # Not recoverable by resuming the same query
+            clear_checkpoint()
             raise
 
-    # Extra TSV for convenience
-    tsv_path = out_csv.with_suffix(".tsv")
-    with open(out_csv, "r", encoding="utf-8-sig", newline="") as fin, \
-         open(tsv_path, "w", encoding="utf-8-sig", newline="") as ftsv:
-        reader = csv.reader(fin)
-        tsv_writer = csv.writer(ftsv, delimiter="\t", lineterminator="\n")
-        for row in reader:
-            tsv_writer.writerow(row)
+    os.replace(part_csv, out_csv)
+    os.replace(part_tsv, tsv_path)
+    remove_stale_variants(out_csv)
+    remove_stale_variants(tsv_path)
 
     info(f"Saved CSV : {os.path.abspath(os.fspath(out_csv))}")
     info(f"Saved TSV : {os.path.abspath(os.fspath(tsv_path))}")
 
     verified_lines = 0
-    with open(out_csv, "r", encoding="utf-8-sig", newline="") as fcheck:
+    with open_input(out_csv, encoding="utf-8-sig", newline="") as fcheck:
         for _ in csv.reader(fcheck):
             verified_lines += 1
     info(f"CSV physical lines (including header): {verified_lines}")
@@ -310,18 +555,22 @@ def main():
         "pricebook_count": len(pricebooks),
         "total_entry_count": total_entries,
         "multi_currency": include_currency,
+        "pricebook_filter": PRICEBOOK2_ID,
         "included_custom_fields": {
             "PricebookEntry": pbe_custom_fields,
             "Product2": product2_custom_fields
         },
         "pricebooks": pricebooks,
     }
-    out_json.write_text(json.dumps(output, ensure_ascii=False, indent=2), encoding="utf-8")
+    with open_output(out_json, "w", encoding="utf-8") as fjson:
+        fjson.write(json.dumps(output, ensure_ascii=False, indent=2))
     info(f"Saved JSON: {os.path.abspath(os.fspath(out_json))}")
+    clear_checkpoint()
 
     header("DONE")
     print(f"✅ Price books exported: {len(pricebooks)}")
     print(f"✅ Total entries exported: {total_entry_rows}")
+    print(f"✅ API usage: {throttle.summary()}")
 
 if __name__ == "__main__":
     try:
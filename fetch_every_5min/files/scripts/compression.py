@@ -0,0 +1,207 @@
+"""Block-parallel gzip/zstd output streams and transparent compressed input.
+
+Output is cut into fixed-size blocks that are compressed independently on
+a thread pool and written in order. Concatenated gzip members and zstd
+frames are themselves valid gzip/zstd streams, so any standard reader can
+decompress the result.
+
+Also home to the other helpers the scripts share: retry with backoff and
+atomic JSON state files.
+"""
+import gzip
+import io
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for OUTPUT_COMPRESSION=zstd
+    zstandard = None
+
+# "none", "gzip" or "zstd"
+OUTPUT_COMPRESSION = (os.environ.get("OUTPUT_COMPRESSION") or "none").strip().lower()
+COMPRESSION_LEVEL = os.environ.get("COMPRESSION_LEVEL", "")
+COMPRESSION_BLOCK_BYTES = int(os.environ.get("COMPRESSION_BLOCK_BYTES", str(1024 * 1024)))
+COMPRESSION_THREADS = max(1, int(os.environ.get("COMPRESSION_THREADS", str(os.cpu_count() or 2))))
+
+# Retry policy for transient API failures (exponential backoff, full jitter)
+SF_RETRY_ATTEMPTS = int(os.environ.get("SF_RETRY_ATTEMPTS", "5"))
+SF_RETRY_BASE_SECONDS = float(os.environ.get("SF_RETRY_BASE_SECONDS", "1"))
+SF_RETRY_MAX_SECONDS = float(os.environ.get("SF_RETRY_MAX_SECONDS", "30"))
+
+SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+def _check_codec(codec: str):
+    if codec not in SUFFIXES:
+        raise ValueError(f"Unknown OUTPUT_COMPRESSION: {codec!r} (expected none, gzip or zstd)")
+    if codec == "zstd" and zstandard is None:
+        raise RuntimeError("OUTPUT_COMPRESSION=zstd requires the 'zstandard' package (pip install zstandard)")
+
+def compressed_path(path: Path, codec: str = None) -> Path:
+    """`path` with the suffix of the configured codec appended."""
+    codec = codec or OUTPUT_COMPRESSION
+    _check_codec(codec)
+    return path.with_name(path.name + SUFFIXES[codec])
+
+def output_variants(path: Path):
+    """All codec variants of an output: `name`, `name.gz` and `name.zst`.
+
+    `path` may carry a codec suffix already; it is stripped first.
+    """
+    base = path
+    for suffix in SUFFIXES.values():
+        if suffix and path.name.endswith(suffix):
+            base = path.with_name(path.name[:-len(suffix)])
+    return [base.with_name(base.name + s) for s in ("", ".gz", ".zst")]
+
+def remove_stale_variants(path: Path):
+    """Delete the other codec variants of `path` left by a previous OUTPUT_COMPRESSION."""
+    for p in output_variants(path):
+        if p != path:
+            p.unlink(missing_ok=True)
+
+def _block_compressor(codec: str):
+    if codec == "gzip":
+        level = int(COMPRESSION_LEVEL or 6)
+        return lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+    level = int(COMPRESSION_LEVEL or 3)
+    local = threading.local()
+    def _zstd(data):
+        # ZstdCompressor instances must not be shared between threads
+        cctx = getattr(local, "cctx", None)
+        if cctx is None:
+            cctx = local.cctx = zstandard.ZstdCompressor(level=level)
+        return cctx.compress(data)
+    return _zstd
+
+class ParallelCompressedWriter(io.RawIOBase):
+    """Binary stream that compresses fixed-size blocks on a thread pool.
+
+    flush() closes the current block, so after it returns the underlying
+    file ends on a block boundary and tell() is a safe truncation point.
+    """
+
+    def __init__(self, raw, codec: str, block_bytes: int = None, threads: int = None):
+        super().__init__()
+        # Settings are read here, not bound as defaults at import time
+        block_bytes = block_bytes or COMPRESSION_BLOCK_BYTES
+        threads = threads or COMPRESSION_THREADS
+        self._raw = raw
+        self._compress = _block_compressor(codec)
+        self._block_bytes = block_bytes
+        self._buf = bytearray()
+        self._pool = ThreadPoolExecutor(max_workers=threads)
+        self._pending = deque()
+        self._max_pending = 2 * threads
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._buf += b
+        while len(self._buf) >= self._block_bytes:
+            self._submit(bytes(self._buf[:self._block_bytes]))
+            del self._buf[:self._block_bytes]
+        return len(b)
+
+    def _submit(self, block: bytes):
+        self._pending.append(self._pool.submit(self._compress, block))
+        while len(self._pending) > self._max_pending:
+            self._raw.write(self._pending.popleft().result())
+
+    def _drain(self):
+        if self._buf:
+            self._submit(bytes(self._buf))
+            self._buf.clear()
+        while self._pending:
+            self._raw.write(self._pending.popleft().result())
+
+    def flush(self):
+        if self.closed:
+            return
+        self._drain()
+        self._raw.flush()
+
+    def tell(self):
+        return self._raw.tell()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            super().close()  # flushes the remaining blocks
+        finally:
+            self._pool.shutdown(wait=True)
+            self._raw.close()
+
+def open_output(path: Path, mode: str = "w", encoding: str = "utf-8", newline=None, codec: str = None):
+    """Open `path` for text writing ("w" or "a"), compressing per `codec`.
+
+    `path` is used as given; use compressed_path() to name it. Other codec
+    variants of the same output are removed (see remove_stale_variants).
+    """
+    codec = codec or OUTPUT_COMPRESSION
+    _check_codec(codec)
+    remove_stale_variants(path)
+    if codec == "none":
+        return open(path, mode, encoding=encoding, newline=newline)
+    if mode == "a" and encoding == "utf-8-sig" and path.exists() and path.stat().st_size:
+        # The compressed stream is not seekable, so TextIOWrapper cannot tell
+        # it is appending and would write a second BOM
+        encoding = "utf-8"
+    raw = open(path, mode + "b")
+    return io.TextIOWrapper(ParallelCompressedWriter(raw, codec), encoding=encoding, newline=newline)
+
+def resolve_input(path: Path) -> Path:
+    """The existing variant of `path` among `path`, `path.gz` and `path.zst` (else `path`).
+
+    Writers remove the other variants, so normally only one exists; if
+    several do (e.g. copied in by hand) the newest wins.
+    """
+    existing = [p for p in output_variants(path) if p.exists()]
+    if not existing:
+        return path
+    return max(existing, key=lambda p: p.stat().st_mtime)
+
+def open_input(path: Path, encoding: str = "utf-8", newline=None):
+    """Open `path` (or its compressed sibling) for text reading, decompressing as needed."""
+    path = resolve_input(path)
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, "rt", encoding=encoding, newline=newline)
+    if magic.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError(f"{path} is zstd-compressed; install the 'zstandard' package to read it")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader, encoding=encoding, newline=newline)
+    return open(path, "r", encoding=encoding, newline=newline)
+
+# ---------- Shared helpers ----------
+def retry_call(fn, *args, label="call", transient=None, **kwargs):
+    """Call fn, retrying failures for which transient(exc) is true with jittered exponential backoff."""
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            attempt += 1
+            if attempt >= SF_RETRY_ATTEMPTS or transient is None or not transient(e):
+                raise
+            delay = random.uniform(0, min(SF_RETRY_MAX_SECONDS, SF_RETRY_BASE_SECONDS * (2 ** attempt)))
+            print(f"- {label} failed ({type(e).__name__}), retry {attempt}/{SF_RETRY_ATTEMPTS - 1} in {delay:.1f}s")
+            time.sleep(delay)
+
+def write_json_atomic(path: Path, data, **dumps_kwargs):
+    """Write `data` as JSON via a temp file and os.replace, so readers never see a partial file."""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data, **dumps_kwargs), encoding="utf-8")
+    os.replace(tmp, path)
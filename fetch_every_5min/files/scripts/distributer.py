@@ -1,9 +1,15 @@
 import os
+import io
 import json
 import csv
+import hashlib
+import shutil
 from pathlib import Path
 from datetime import datetime, timezone
 
+import price_history
+from compression import compressed_path, open_input, open_output, output_variants, remove_stale_variants, write_json_atomic
+
 BASE_DIR = Path(__file__).resolve().parent.parent  # .../files
 
 # ENV overrides
@@ -12,9 +18,19 @@ INPUT_JSON = Path(os.environ.get("PRICEBOOK_JSON", str(PRICEBOOK_DIR / "priceboo
 OUTPUT_DIR = Path(os.environ.get("DISTRIBUTER_OUTPUT_DIR", str(BASE_DIR / "salesforce")))
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-OUT_ENTRIES = OUTPUT_DIR / "pricebookEntries.csv"
-OUT_PRICEBOOKS = OUTPUT_DIR / "pricebooks.csv"
-OUT_PRODUCTS = OUTPUT_DIR / "products.csv"
+# Compressed outputs (OUTPUT_COMPRESSION) get a .gz/.zst suffix
+OUT_ENTRIES = compressed_path(OUTPUT_DIR / "pricebookEntries.csv")
+OUT_PRICEBOOKS = compressed_path(OUTPUT_DIR / "pricebooks.csv")
+OUT_PRODUCTS = compressed_path(OUTPUT_DIR / "products.csv")
+
+# Entries layout: "single" (pricebookEntries.csv), "partitioned" (one file per
+# Pricebook2Id under pricebookEntries/ plus index.json) or "both"
+ENTRIES_LAYOUT = (os.environ.get("DISTRIBUTER_ENTRIES_LAYOUT") or "single").strip().lower()
+OUT_ENTRIES_PARTITION_DIR = OUTPUT_DIR / "pricebookEntries"
+OUT_ENTRIES_INDEX = OUT_ENTRIES_PARTITION_DIR / "index.json"
+
+# Append price field changes to the history store (see price_history.py)
+PRICE_HISTORY_ENABLED = os.environ.get("PRICE_HISTORY", "true").lower() in ("1","true","yes","y")
 
 FIXED_USER_ID = os.environ.get("DISTRIBUTER_FIXED_USER_ID", "005N1000006UI0rIAG")
 FALSE_STR = "FALSE"
@@ -164,8 +180,78 @@ def product_to_row(prod, now_iso):
         row.setdefault(h, "")
     return row
 
+def _rows_to_csv_text(rows, fieldnames):
+    buf = io.StringIO()
+    w = csv.DictWriter(buf, fieldnames=fieldnames, extrasaction="ignore", lineterminator="\r\n")
+    w.writeheader(); w.writerows(rows)
+    return buf.getvalue()
+
+def partition_content_hash(rows):
+    # SystemModstamp is stamped fresh every run, so it is left out of the hash
+    h = hashlib.sha256()
+    for row in rows:
+        h.update("\x1f".join(str(row.get(k, "")) for k in ENTRY_HEADERS if k != "SystemModstamp").encode("utf-8"))
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+def write_entry_partitions(entry_rows, pricebook_names):
+    """Write one entries CSV per Pricebook2Id, rewriting only changed partitions."""
+    OUT_ENTRIES_PARTITION_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        previous = json.loads(OUT_ENTRIES_INDEX.read_text(encoding="utf-8")).get("partitions", {})
+    except (OSError, ValueError):
+        previous = {}
+
+    grouped = {}
+    for row in entry_rows:
+        grouped.setdefault(row.get("Pricebook2Id") or "", []).append(row)
+
+    partitions = {}
+    written = 0
+    for pb_id in sorted(grouped):
+        rows = grouped[pb_id]
+        file_name = compressed_path(Path(f"{pb_id or '_none'}.csv")).name
+        path = OUT_ENTRIES_PARTITION_DIR / file_name
+        content_hash = partition_content_hash(rows)
+        prev = previous.get(pb_id) or {}
+        if prev.get("content_hash") != content_hash or not path.exists():
+            tmp = path.with_name(path.name + ".tmp")
+            with open_output(tmp, "w", encoding="utf-8", newline="") as f:
+                f.write(_rows_to_csv_text(rows, ENTRY_HEADERS))
+            os.replace(tmp, path)
+            remove_stale_variants(path)
+            written += 1
+            if prev.get("file") and prev["file"] != file_name:
+                (OUT_ENTRIES_PARTITION_DIR / prev["file"]).unlink(missing_ok=True)
+        partitions[pb_id] = {
+            "file": file_name,
+            "name": pricebook_names.get(pb_id, ""),
+            "rows": len(rows),
+            "content_hash": content_hash,
+        }
+
+    removed = 0
+    for pb_id, prev in previous.items():
+        if pb_id not in partitions and prev.get("file"):
+            (OUT_ENTRIES_PARTITION_DIR / prev["file"]).unlink(missing_ok=True)
+            removed += 1
+
+    index = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "headers": ENTRY_HEADERS,
+        "total_rows": len(entry_rows),
+        "partitions": partitions,
+    }
+    write_json_atomic(OUT_ENTRIES_INDEX, index, ensure_ascii=False, indent=2)
+    return len(partitions), written, removed
+
 def main():
-    data = json.loads(INPUT_JSON.read_text(encoding="utf-8"))
+    if ENTRIES_LAYOUT not in ("single", "partitioned", "both"):
+        raise SystemExit(f"Unknown DISTRIBUTER_ENTRIES_LAYOUT: {ENTRIES_LAYOUT!r}")
+
+    # Accepts a .gz/.zst export as well (see compression.resolve_input)
+    with open_input(INPUT_JSON, encoding="utf-8") as f:
+        data = json.load(f)
     now_iso = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
 
     entry_rows = []
@@ -183,21 +269,47 @@ def main():
     pricebook_rows = [pricebook_to_row(pb, now_iso) for pb in data.get("pricebooks", [])]
     product_rows = [product_to_row(prod, now_iso) for prod in product_map.values()]
 
-    with OUT_ENTRIES.open("w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=ENTRY_HEADERS, extrasaction="ignore")
-        w.writeheader(); w.writerows(entry_rows)
+    if ENTRIES_LAYOUT in ("single", "both"):
+        with open_output(OUT_ENTRIES, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=ENTRY_HEADERS, extrasaction="ignore")
+            w.writeheader(); w.writerows(entry_rows)
+        print(f"Wrote {len(entry_rows)} entry rows -> {OUT_ENTRIES}")
+    else:
+        # Readers would otherwise keep picking up a stale single file
+        for p in output_variants(OUT_ENTRIES):
+            p.unlink(missing_ok=True)
+
+    if ENTRIES_LAYOUT in ("partitioned", "both"):
+        pricebook_names = {get(pb, "Id"): get(pb, "Name") for pb in data.get("pricebooks", [])}
+        total, written, removed = write_entry_partitions(entry_rows, pricebook_names)
+        print(f"Entry partitions: {total} ({written} rewritten, {removed} removed) -> {OUT_ENTRIES_PARTITION_DIR}")
+    elif OUT_ENTRIES_PARTITION_DIR.exists():
+        # The loader prefers index.json whenever it exists
+        shutil.rmtree(OUT_ENTRIES_PARTITION_DIR)
 
-    with OUT_PRICEBOOKS.open("w", newline="", encoding="utf-8") as f:
+    with open_output(OUT_PRICEBOOKS, "w", newline="", encoding="utf-8") as f:
         w = csv.DictWriter(f, fieldnames=PRICEBOOK_HEADERS, extrasaction="ignore")
         w.writeheader(); w.writerows(pricebook_rows)
 
-    with OUT_PRODUCTS.open("w", newline="", encoding="utf-8") as f:
+    with open_output(OUT_PRODUCTS, "w", newline="", encoding="utf-8") as f:
         w = csv.DictWriter(f, fieldnames=PRODUCT_HEADERS, extrasaction="ignore")
         w.writeheader(); w.writerows(product_rows)
 
-    print(f"Wrote {len(entry_rows)} entry rows -> {OUT_ENTRIES}")
     print(f"Wrote {len(pricebook_rows)} pricebooks -> {OUT_PRICEBOOKS}")
     print(f"Wrote {len(product_rows)} products -> {OUT_PRODUCTS}")
 
+    if PRICE_HISTORY_ENABLED:
+        exported_at = data.get("exported_at")
+        ts = price_history.to_epoch(exported_at) if exported_at else int(datetime.now(timezone.utc).timestamp())
+        entries = (e for pb in data.get("pricebooks", []) for e in (pb.get("Entries", []) or []))
+        conn = price_history.connect()
+        try:
+            appended = price_history.record_snapshot(conn, entries, ts, data.get("pricebook_filter"))
+            print(f"Price history: {appended} changes appended -> {price_history.HISTORY_DB}")
+        except ValueError as e:
+            print(f"Price history: skipped: {e}")
+        finally:
+            conn.close()
+
 if __name__ == "__main__":
     main()
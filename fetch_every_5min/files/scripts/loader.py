@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+import os
+import io
+import csv
+import json
+import time
+import hashlib
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from simple_salesforce import Salesforce, SalesforceAuthenticationFailed
+
+from compression import open_input, resolve_input, retry_call, write_json_atomic
+
+BASE_DIR = Path(__file__).resolve().parent.parent  # .../files
+
+# ---------- Config from ENV ----------
+INPUT_DIR = Path(os.environ.get("DISTRIBUTER_OUTPUT_DIR", str(BASE_DIR / "salesforce")))
+STATE_DIR = Path(os.environ.get("LOADER_STATE_DIR", str(BASE_DIR / "state" / "loader")))
+SNAPSHOT_DIR = STATE_DIR / "snapshot"
+FAILED_DIR = STATE_DIR / "failed"
+
+# Target org: either an existing session (instance URL + token) or a login
+TARGET_SF_INSTANCE_URL = (os.environ.get("TARGET_SF_INSTANCE_URL") or "").rstrip("/")
+TARGET_SF_ACCESS_TOKEN = os.environ.get("TARGET_SF_ACCESS_TOKEN", "")
+TARGET_SF_USERNAME = os.environ.get("TARGET_SF_USERNAME", "")
+TARGET_SF_PASSWORD = os.environ.get("TARGET_SF_PASSWORD", "")
+TARGET_SF_SECURITY_TOKEN = os.environ.get("TARGET_SF_SECURITY_TOKEN", "")
+TARGET_SF_DOMAIN = (os.environ.get("TARGET_SF_DOMAIN") or "login").lower()
+
+API_VERSION = os.environ.get("LOADER_API_VERSION", "59.0")
+
+# Batch bounds; each batch is uploaded as its own ingest job
+BATCH_MAX_ROWS = int(os.environ.get("LOADER_BATCH_MAX_ROWS", "10000"))
+BATCH_MAX_BYTES = int(os.environ.get("LOADER_BATCH_MAX_BYTES", str(100 * 1024 * 1024)))
+MAX_WORKERS = max(1, int(os.environ.get("LOADER_MAX_WORKERS", "4")))
+
+POLL_SECONDS = float(os.environ.get("LOADER_POLL_SECONDS", "2"))
+JOB_TIMEOUT_SECONDS = float(os.environ.get("LOADER_JOB_TIMEOUT_SECONDS", "600"))
+# Extra passes over rows the org rejected (e.g. UNABLE_TO_LOCK_ROW)
+FAILED_ROW_RETRIES = int(os.environ.get("LOADER_FAILED_ROW_RETRIES", "1"))
+
+# Only send rows that changed since the last successful load
+ONLY_CHANGED = os.environ.get("LOADER_ONLY_CHANGED", "true").lower() in ("1","true","yes","y")
+
+
+# Load order matters: entries reference pricebooks and products
+OBJECTS = [
+    {"sobject": "Pricebook2", "file": "pricebooks.csv"},
+    {"sobject": "Product2", "file": "products.csv"},
+    {"sobject": "PricebookEntry", "file": "pricebookEntries.csv"},
+]
+
+def header(title: str):
+    print("\n" + "=" * 170)
+    print(title)
+    print("=" * 170)
+
+def info(msg: str):
+    print(f"- {msg}")
+
+def external_id_field(sobject: str) -> str:
+    return os.environ.get(f"LOADER_{sobject.upper()}_EXTERNAL_ID", "Id")
+
+def load_fields(sobject: str, headers, describe: dict, ext_id: str):
+    """Columns to send for new and for existing rows, from the target's describe.
+
+    Returns (create_fields, update_fields). Both start with `ext_id`.
+    Formula and system fields are neither createable nor updateable and
+    are dropped. Create-only fields (e.g. PricebookEntry.Pricebook2Id) are
+    left out of update_fields.
+    """
+    override = os.environ.get(f"LOADER_{sobject.upper()}_FIELDS")
+    candidates = [f for f in override.replace(",", " ").split() if f] if override else list(headers)
+    createable = {f["name"] for f in describe.get("fields", []) if f.get("createable")}
+    updateable = {f["name"] for f in describe.get("fields", []) if f.get("updateable")}
+    create_fields = [ext_id] + [f for f in candidates if f != ext_id and f in createable]
+    update_fields = [ext_id] + [f for f in candidates if f != ext_id and f in updateable]
+    return create_fields, update_fields
+
+# ---------- HTTP ----------
+def _is_transient(exc) -> bool:
+    if isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code >= 500
+    return False
+
+class BulkClient:
+    """Minimal Bulk API 2.0 ingest client over a requests session."""
+
+    def __init__(self, instance_url: str, access_token: str):
+        self.data_base = f"{instance_url}/services/data/v{API_VERSION}"
+        self.base = f"{self.data_base}/jobs/ingest"
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {access_token}",
+            "Accept": "application/json",
+        })
+
+    def _request(self, method, url, **kwargs):
+        def _send():
+            resp = self.session.request(method, url, timeout=120, **kwargs)
+            resp.raise_for_status()
+            return resp
+        return retry_call(_send, label=f"{method} {url}", transient=_is_transient)
+
+    def describe(self, sobject: str) -> dict:
+        return self._request("GET", f"{self.data_base}/sobjects/{sobject}/describe/").json()
+
+    def create_job(self, sobject: str, ext_id: str) -> str:
+        resp = self._request("POST", self.base, json={
+            "object": sobject,
+            "externalIdFieldName": ext_id,
+            "contentType": "CSV",
+            "operation": "upsert",
+            "lineEnding": "LF",
+        })
+        return resp.json()["id"]
+
+    def upload(self, job_id: str, payload: bytes):
+        self._request("PUT", f"{self.base}/{job_id}/batches", data=payload,
+                      headers={"Content-Type": "text/csv"})
+        self._request("PATCH", f"{self.base}/{job_id}", json={"state": "UploadComplete"})
+
+    def abort(self, job_id: str):
+        try:
+            self._request("PATCH", f"{self.base}/{job_id}", json={"state": "Aborted"})
+        except Exception:
+            pass
+
+    def wait(self, job_id: str) -> dict:
+        deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+        while True:
+            job = self._request("GET", f"{self.base}/{job_id}").json()
+            if job.get("state") in ("JobComplete", "Failed", "Aborted"):
+                return job
+            if time.monotonic() > deadline:
+                self.abort(job_id)
+                raise TimeoutError(f"Ingest job {job_id} still {job.get('state')} after {JOB_TIMEOUT_SECONDS:.0f}s")
+            time.sleep(POLL_SECONDS)
+
+    def failed_results(self, job_id: str):
+        resp = self._request("GET", f"{self.base}/{job_id}/failedResults/",
+                             headers={"Accept": "text/csv"})
+        return list(csv.DictReader(io.StringIO(resp.content.decode("utf-8"))))
+
+def connect() -> BulkClient:
+    if TARGET_SF_INSTANCE_URL and TARGET_SF_ACCESS_TOKEN:
+        info(f"Target instance: {TARGET_SF_INSTANCE_URL} (token)")
+        return BulkClient(TARGET_SF_INSTANCE_URL, TARGET_SF_ACCESS_TOKEN)
+    missing = [k for k, v in {
+        "TARGET_SF_USERNAME": TARGET_SF_USERNAME,
+        "TARGET_SF_PASSWORD": TARGET_SF_PASSWORD,
+        "TARGET_SF_SECURITY_TOKEN": TARGET_SF_SECURITY_TOKEN,
+    }.items() if not v]
+    if missing:
+        raise RuntimeError(f"Missing required environment variables: {', '.join(missing)}")
+    try:
+        sf = Salesforce(
+            username=TARGET_SF_USERNAME,
+            password=TARGET_SF_PASSWORD,
+            security_token=TARGET_SF_SECURITY_TOKEN,
+            domain=TARGET_SF_DOMAIN,
+        )
+    except SalesforceAuthenticationFailed as e:
+        details = getattr(e, "content", None) or str(e)
+        raise RuntimeError(f"Target Salesforce login failed. Details: {details}") from e
+    info(f"Target instance: {sf.sf_instance} (user {TARGET_SF_USERNAME})")
+    return BulkClient(f"https://{sf.sf_instance}", sf.session_id)
+
+# ---------- Input / snapshot ----------
+def read_rows(spec):
+    # Partitioned entries layout (see distributer.py) takes precedence
+    index_path = INPUT_DIR / "pricebookEntries" / "index.json"
+    if spec["sobject"] == "PricebookEntry" and index_path.exists():
+        index = json.loads(index_path.read_text(encoding="utf-8"))
+        rows = []
+        for part in index.get("partitions", {}).values():
+            with open_input(index_path.parent / part["file"], newline="", encoding="utf-8") as f:
+                rows.extend(csv.DictReader(f))
+        return list(index.get("headers", [])), rows
+
+    path = INPUT_DIR / spec["file"]
+    if resolve_input(path).exists():
+        with open_input(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            return list(reader.fieldnames or []), list(reader)
+    return [], []
+
+def row_hash(row, fields) -> str:
+    return hashlib.sha1("\x1f".join(row.get(f, "") for f in fields).encode("utf-8")).hexdigest()
+
+def load_snapshot(sobject: str) -> dict:
+    try:
+        return json.loads((SNAPSHOT_DIR / f"{sobject}.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def save_snapshot(sobject: str, snapshot: dict):
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    path = SNAPSHOT_DIR / f"{sobject}.json"
+    write_json_atomic(path, snapshot)
+
+def write_failed(sobject: str, fields, failures):
+    FAILED_DIR.mkdir(parents=True, exist_ok=True)
+    path = FAILED_DIR / f"{sobject}.csv"
+    if not failures:
+        path.unlink(missing_ok=True)
+        return
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=["sf__Error"] + fields, extrasaction="ignore")
+        w.writeheader()
+        for row, error in failures:
+            w.writerow(dict(row, sf__Error=error))
+    info(f"{len(failures)} failed {sobject} rows -> {path}")
+
+# ---------- Batching / upload ----------
+def make_batches(rows, fields):
+    """Split rows into CSV payloads bounded by BATCH_MAX_ROWS and BATCH_MAX_BYTES."""
+    def _line(values):
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\n").writerow(values)
+        return buf.getvalue().encode("utf-8")
+
+    head = _line(fields)
+    batches = []
+    cur_rows, cur_lines, cur_bytes = [], [head], len(head)
+    for row in rows:
+        line = _line([row.get(f, "") for f in fields])
+        if cur_rows and (len(cur_rows) >= BATCH_MAX_ROWS or cur_bytes + len(line) > BATCH_MAX_BYTES):
+            batches.append((cur_rows, b"".join(cur_lines)))
+            cur_rows, cur_lines, cur_bytes = [], [head], len(head)
+        cur_rows.append(row)
+        cur_lines.append(line)
+        cur_bytes += len(line)
+    if cur_rows:
+        batches.append((cur_rows, b"".join(cur_lines)))
+    return batches
+
+def run_batch(client: BulkClient, sobject: str, ext_id: str, rows, payload: bytes):
+    """Upload one batch as an ingest job; returns ([(row, error)], summary)."""
+    job_id = None
+    try:
+        job_id = client.create_job(sobject, ext_id)
+        client.upload(job_id, payload)
+        job = client.wait(job_id)
+    except Exception as e:
+        if job_id:
+            # Don't leave an Open job behind in the target org
+            client.abort(job_id)
+        error = f"{type(e).__name__}: {e}"
+        return [(row, error) for row in rows], f"{sobject} batch of {len(rows)} failed: {error}"
+
+    state = job.get("state")
+    if state != "JobComplete":
+        reason = job.get("errorMessage") or state
+        return [(row, f"Job {job_id} {state}: {reason}") for row in rows], f"{sobject} job {job_id}: {state}"
+
+    processed, failed = job.get("numberRecordsProcessed", 0), job.get("numberRecordsFailed", 0)
+    summary = f"{sobject} job {job_id}: {processed} processed, {failed} failed"
+    if not failed:
+        return [], summary
+    by_key = {row.get(ext_id, ""): row for row in rows}
+    return [(by_key.get(r.get(ext_id, ""), r), r.get("sf__Error", "")) for r in client.failed_results(job_id)], summary
+
+def upsert_rows(client: BulkClient, sobject: str, ext_id: str, rows, fields, label: str = ""):
+    failures = []
+    batches = make_batches(rows, fields)
+    info(f"{sobject}: {len(rows)} {label}rows in {len(batches)} batches")
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = [pool.submit(run_batch, client, sobject, ext_id, r, p) for r, p in batches]
+        for fut in futures:
+            batch_failures, summary = fut.result()
+            failures.extend(batch_failures)
+            info(summary)
+    return failures
+
+def load_object(client: BulkClient, spec):
+    sobject = spec["sobject"]
+    headers, rows = read_rows(spec)
+    if not rows:
+        info(f"{sobject}: no input rows")
+        return 0, 0
+
+    ext_id = external_id_field(sobject)
+    create_fields, update_fields = load_fields(sobject, headers, client.describe(sobject), ext_id)
+    fields = create_fields + [f for f in update_fields if f not in create_fields]
+    if sobject == "Pricebook2":
+        # The standard price book cannot be created or updated through the API
+        rows = [r for r in rows if str(r.get("IsStandard", "")).lower() != "true"]
+
+    snapshot = load_snapshot(sobject)
+    hashes = {r.get(ext_id, ""): row_hash(r, fields) for r in rows}
+    if ONLY_CHANGED:
+        todo = [r for r in rows if snapshot.get(r.get(ext_id, "")) != hashes[r.get(ext_id, "")]]
+    else:
+        todo = list(rows)
+    info(f"{sobject}: {len(todo)} of {len(rows)} rows changed")
+
+    def _exists(row):
+        # Upserting on Id only ever matches records that already exist (which
+        # also means the target must be the source org); for an external id,
+        # rows loaded successfully before are known to exist
+        return ext_id == "Id" or row.get(ext_id, "") in snapshot
+
+    failures = []
+    attempt = 0
+    while todo:
+        updates = [r for r in todo if _exists(r)]
+        inserts = [r for r in todo if not _exists(r)]
+        failures = []
+        if updates:
+            failures += upsert_rows(client, sobject, ext_id, updates, update_fields, "existing ")
+        if inserts:
+            failures += upsert_rows(client, sobject, ext_id, inserts, create_fields, "new ")
+        failed_keys = {row.get(ext_id, "") for row, _ in failures}
+        for r in todo:
+            key = r.get(ext_id, "")
+            if key not in failed_keys:
+                snapshot[key] = hashes[key]
+        if not failures or attempt >= FAILED_ROW_RETRIES:
+            break
+        attempt += 1
+        todo = [row for row, _ in failures]
+        info(f"{sobject}: retrying {len(todo)} failed rows (pass {attempt}/{FAILED_ROW_RETRIES})")
+
+    # Failed rows get no hash so the next run sends them again; rows known
+    # to exist keep their key so they are still sent as updates
+    for row, _ in failures:
+        key = row.get(ext_id, "")
+        if key in snapshot:
+            snapshot[key] = None
+    save_snapshot(sobject, snapshot)
+    write_failed(sobject, fields, failures)
+    return len(rows), len(failures)
+
+def main():
+    header("BULK UPSERT TO TARGET ORG")
+    client = connect()
+    total_failed = 0
+    for spec in OBJECTS:
+        header(f"LOAD {spec['sobject']}")
+        total, failed = load_object(client, spec)
+        total_failed += failed
+        print(f"{spec['sobject']}: {total} rows, {failed} failed")
+    return 1 if total_failed else 0
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except Exception as e:
+        print("\n" + "=" * 70)
+        print("ERROR")
+        print("=" * 70)
+        print(f"{type(e).__name__}: {e}")
+        sys.exit(1)
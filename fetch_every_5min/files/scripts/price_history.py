@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""Append-only history of PricebookEntry price fields.
+
+Only changes are stored: one row per (entry, field, time) whose value
+differs from the previous one, so the store grows with the number of
+changes rather than the number of cycles. Ids and field names are
+dictionary-encoded to small integers and times are epoch seconds.
+
+Usage:
+    price_history.py at <entry_id> <iso_time> [field]
+    price_history.py since <pricebook_id> <iso_time>
+"""
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent  # .../files
+
+HISTORY_DB = Path(os.environ.get("PRICE_HISTORY_DB", str(BASE_DIR / "history" / "price_history.sqlite3")))
+
+DEFAULT_FIELDS = [
+    "UnitPrice","IsActive",
+    "X1_years_apps_discount__c","Onemedia_discount__c","Trade_discount__c","Tripleplay_discount__c",
+    "Onemedia_unit_cost__c","Trade_Unit_Price__c","Tripleplay_Unit_Price__c",
+]
+TRACKED_FIELDS = [f for f in (os.environ.get("PRICE_HISTORY_FIELDS") or " ".join(DEFAULT_FIELDS)).replace(",", " ").split() if f]
+
+# Synthetic field recording whether the entry exists ("1") or vanished ("0")
+PRESENT_FIELD = "_present"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pricebooks (
+    pricebook_key INTEGER PRIMARY KEY,
+    pricebook_id  TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS entries (
+    entry_key     INTEGER PRIMARY KEY,
+    entry_id      TEXT NOT NULL UNIQUE,
+    pricebook_key INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fields (
+    field_key INTEGER PRIMARY KEY,
+    name      TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS changes (
+    entry_key     INTEGER NOT NULL,
+    field_key     INTEGER NOT NULL,
+    ts            INTEGER NOT NULL,
+    pricebook_key INTEGER NOT NULL,
+    value         TEXT,
+    PRIMARY KEY (entry_key, field_key, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS changes_by_pricebook ON changes (pricebook_key, ts);
+CREATE TABLE IF NOT EXISTS latest (
+    entry_key INTEGER NOT NULL,
+    field_key INTEGER NOT NULL,
+    value     TEXT,
+    PRIMARY KEY (entry_key, field_key)
+) WITHOUT ROWID;
+"""
+
+def normalize(value):
+    if value is None or value == "":
+        return None
+    return str(value)
+
+def to_epoch(iso_ts: str) -> int:
+    dt = datetime.fromisoformat(iso_ts.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+def from_epoch(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+def connect(path: Path = HISTORY_DB) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path))
+    conn.executescript(SCHEMA)
+    return conn
+
+def _key_map(conn, table, key_col, name_col):
+    return {name: key for key, name in conn.execute(f"SELECT {key_col}, {name_col} FROM {table}")}
+
+def _intern(conn, cache, table, name_col, name, extra=None):
+    key = cache.get(name)
+    if key is None:
+        cols = [name_col] + list((extra or {}).keys())
+        vals = [name] + list((extra or {}).values())
+        cur = conn.execute(
+            f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})", vals,
+        )
+        key = cache[name] = cur.lastrowid
+    return key
+
+def record_snapshot(conn, entries, ts: int, pricebook_filter=None):
+    """Append changes between the stored latest values and `entries`.
+
+    `entries` is an iterable of dicts with Id, Pricebook2Id and the
+    tracked fields. Entries missing from the snapshot are marked absent,
+    limited to `pricebook_filter` when the export was filtered.
+    Returns the number of change rows appended.
+
+    Raises ValueError if the snapshot has changes but `ts` is not newer
+    than the last recorded change (e.g. an older export, or the same
+    export time recorded twice with different content); nothing is written.
+    """
+    fields = TRACKED_FIELDS + [PRESENT_FIELD]
+    with conn:
+        pb_keys = _key_map(conn, "pricebooks", "pricebook_key", "pricebook_id")
+        entry_keys = _key_map(conn, "entries", "entry_key", "entry_id")
+        field_cache = _key_map(conn, "fields", "field_key", "name")
+        field_keys = {f: _intern(conn, field_cache, "fields", "name", f) for f in fields}
+        latest = {(ek, fk): v for ek, fk, v in conn.execute("SELECT entry_key, field_key, value FROM latest")}
+        entry_pb = dict(conn.execute("SELECT entry_key, pricebook_key FROM entries"))
+
+        changes = []
+        seen = set()
+        for e in entries:
+            entry_id = e.get("Id")
+            if not entry_id:
+                continue
+            pb_key = _intern(conn, pb_keys, "pricebooks", "pricebook_id", e.get("Pricebook2Id") or "")
+            ek = entry_keys.get(entry_id)
+            if ek is None:
+                ek = _intern(conn, entry_keys, "entries", "entry_id", entry_id, {"pricebook_key": pb_key})
+                entry_pb[ek] = pb_key
+            seen.add(ek)
+            values = {f: normalize(e.get(f)) for f in TRACKED_FIELDS}
+            values[PRESENT_FIELD] = "1"
+            for f, v in values.items():
+                fk = field_keys[f]
+                # A field never seen before reads as None, so a None there is not a change
+                if latest.get((ek, fk)) != v:
+                    changes.append((ek, fk, ts, pb_key, v))
+
+        present_fk = field_keys[PRESENT_FIELD]
+        filter_key = pb_keys.get(pricebook_filter) if pricebook_filter else None
+        for (ek, fk), v in latest.items():
+            if fk != present_fk or v != "1" or ek in seen:
+                continue
+            if pricebook_filter and entry_pb.get(ek) != filter_key:
+                continue
+            changes.append((ek, fk, ts, entry_pb.get(ek, 0), "0"))
+
+        if changes:
+            # Per pricebook so each lookup is a seek on changes_by_pricebook
+            newest = conn.execute(
+                "SELECT MAX((SELECT MAX(ts) FROM changes c WHERE c.pricebook_key = p.pricebook_key)) FROM pricebooks p"
+            ).fetchone()[0]
+            if newest is not None and ts <= newest:
+                raise ValueError(
+                    f"snapshot at {from_epoch(ts)} differs from the history but is not newer than "
+                    f"its last change ({from_epoch(newest)})"
+                )
+        try:
+            conn.executemany(
+                "INSERT INTO changes (entry_key, field_key, ts, pricebook_key, value) VALUES (?, ?, ?, ?, ?)",
+                changes,
+            )
+        except sqlite3.IntegrityError:
+            # Only reachable if another writer recorded the same time concurrently
+            raise ValueError(f"changes already recorded at {from_epoch(ts)} differ from this snapshot") from None
+        conn.executemany(
+            "INSERT OR REPLACE INTO latest (entry_key, field_key, value) VALUES (?, ?, ?)",
+            [(ek, fk, v) for ek, fk, _, _, v in changes],
+        )
+    return len(changes)
+
+def _value_at(conn, entry_id: str, ts: int, field: str):
+    row = conn.execute(
+        """
+        SELECT c.value FROM changes c
+        JOIN entries e ON e.entry_key = c.entry_key
+        JOIN fields f ON f.field_key = c.field_key
+        WHERE e.entry_id = ? AND f.name = ? AND c.ts <= ?
+        ORDER BY c.ts DESC LIMIT 1
+        """,
+        (entry_id, field, ts),
+    ).fetchone()
+    return row[0] if row else None
+
+def value_at(conn, entry_id: str, ts: int, field: str = "UnitPrice"):
+    """Value of `field` for entry `entry_id` as of epoch `ts`.
+
+    None if unknown, or if the entry was absent from the export at `ts`.
+    """
+    if _value_at(conn, entry_id, ts, PRESENT_FIELD) != "1":
+        return None
+    return _value_at(conn, entry_id, ts, field)
+
+def changes_since(conn, pricebook_id: str, ts: int):
+    """All changes in pricebook `pricebook_id` after epoch `ts`, oldest first."""
+    return [
+        {"ts": from_epoch(r[0]), "entry_id": r[1], "field": r[2], "value": r[3]}
+        for r in conn.execute(
+            """
+            SELECT c.ts, e.entry_id, f.name, c.value FROM changes c
+            JOIN pricebooks p ON p.pricebook_key = c.pricebook_key
+            JOIN entries e ON e.entry_key = c.entry_key
+            JOIN fields f ON f.field_key = c.field_key
+            WHERE p.pricebook_id = ? AND c.ts > ?
+            ORDER BY c.ts, e.entry_id, f.name
+            """,
+            (pricebook_id, ts),
+        )
+    ]
+
+def main(argv):
+    if len(argv) < 3 or argv[0] not in ("at", "since"):
+        print(__doc__.strip())
+        return 2
+    conn = connect()
+    ts = to_epoch(argv[2])
+    if argv[0] == "at":
+        field_name = argv[3] if len(argv) > 3 else "UnitPrice"
+        print(value_at(conn, argv[1], ts, field_name))
+    else:
+        for ch in changes_since(conn, argv[1], ts):
+            print(f"{ch['ts']}\t{ch['entry_id']}\t{ch['field']}\t{ch['value'] if ch['value'] is not None else ''}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -8,7 +8,14 @@ import locale
 import os
 import io
 import re
-from typing import List
+import json
+import hashlib
+import fnmatch
+import importlib.util
+import csv
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Dict, List
 
 # =======================
 # Config via ENV (no INI)
@@ -20,6 +27,16 @@ SCRIPTS_DIRNAME = os.environ.get("RUNNER_SCRIPTS_DIR", "files/scripts")
 # e.g. "app.py distributer.py"
 SCRIPTS_LIST = os.environ.get("RUNNER_SCRIPTS", "app.py distributer.py")
 
+# Optional JSON file (relative to this file) declaring per-script stage
+# dependencies/inputs/outputs; merged over DEFAULT_STAGE_GRAPH
+STAGE_GRAPH_FILE = os.environ.get("RUNNER_STAGE_GRAPH", "")
+
+# Max number of independent stages run concurrently
+MAX_PARALLEL = max(1, int(os.environ.get("RUNNER_MAX_PARALLEL", "4")))
+
+# Skip stages whose declared inputs are unchanged since their last success
+SKIP_UNCHANGED = os.environ.get("RUNNER_SKIP_UNCHANGED", "true").lower() in ("1", "true", "yes", "y")
+
 # Log rollover config
 MAX_LOG_BYTES = int(os.environ.get("RUNNER_MAX_LOG_BYTES", str(20 * 1024 * 1024)))  # 20MB
 
@@ -44,6 +61,55 @@ BASE_DIR = Path(__file__).resolve().parent
 LOG_DIR = BASE_DIR / "logs"
 ARCHIVE_DIR = LOG_DIR / "archive"
 SCRIPTS_DIR = BASE_DIR / SCRIPTS_DIRNAME
+FILES_DIR = SCRIPTS_DIR.parent
+STAGE_STATE_PATH = FILES_DIR / "state" / "runner_stages.json"
+
+# ---------- Stage graph ----------
+# Paths in "inputs"/"outputs" are relative to FILES_DIR. A stage depends on
+# every stage listed in "after" and on whichever stage produces its inputs.
+# "volatile" names top-level JSON keys and CSV columns that change every
+# cycle without the data changing; they are left out of the input hash so
+# an unchanged export can still be skipped. "env" lists the environment
+# variables (fnmatch patterns) the stage reads; their values and the code
+# in SCRIPTS_DIR are part of the skip check too.
+DEFAULT_STAGE_GRAPH = {
+    "app.py": {
+        "inputs": [],
+        "outputs": [
+            "pricebook/pricebooks_export.json",
+            "pricebook/pricebooks_export.csv",
+            "pricebook/pricebooks_export.tsv",
+        ],
+    },
+    "distributer.py": {
+        "inputs": ["pricebook/pricebooks_export.json"],
+        "outputs": ["salesforce/pricebooks.csv", "salesforce/products.csv"],
+        "volatile": ["exported_at"],
+        "env": ["OUTPUT_COMPRESSION", "DISTRIBUTER_*", "PRICEBOOK_DIR", "PRICEBOOK_JSON", "PRICE_HISTORY*"],
+    },
+    # Optional: add loader.py to RUNNER_SCRIPTS to upsert into a target org
+    "loader.py": {
+        "inputs": [
+            "salesforce/pricebooks.csv",
+            "salesforce/products.csv",
+            "salesforce/pricebookEntries.csv",
+            "salesforce/pricebookEntries/index.json",
+        ],
+        "outputs": [],
+        "volatile": ["SystemModstamp", "generated_at"],
+        "env": ["LOADER_*", "DISTRIBUTER_OUTPUT_DIR", "TARGET_SF_INSTANCE_URL", "TARGET_SF_USERNAME", "TARGET_SF_DOMAIN"],
+    },
+}
+
+@dataclass
+class Stage:
+    name: str
+    after: List[str] = field(default_factory=list)
+    inputs: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    volatile: List[str] = field(default_factory=list)
+    env: List[str] = field(default_factory=list)
+    deps: List[str] = field(default_factory=list)
 
 def ensure_dirs():
     LOG_DIR.mkdir(parents=True, exist_ok=True)
@@ -204,6 +270,210 @@ def run_script(script_path: Path, logger: logging.Logger) -> int:
     logger.info(f"Finished {script_path.name}: rc={proc.returncode} in {dur:.1f}s")
     return proc.returncode
 
+def load_stage_graph() -> Dict[str, dict]:
+    graph = {k: dict(v) for k, v in DEFAULT_STAGE_GRAPH.items()}
+    if STAGE_GRAPH_FILE:
+        path = Path(STAGE_GRAPH_FILE)
+        if not path.is_absolute():
+            path = BASE_DIR / path
+        graph.update(json.loads(path.read_text(encoding="utf-8")))
+    return graph
+
+def build_stages(script_names: List[str], graph: Dict[str, dict], logger: logging.Logger) -> Dict[str, Stage]:
+    stages: Dict[str, Stage] = {}
+    for idx, name in enumerate(script_names):
+        spec = graph.get(name)
+        if spec is None:
+            # Undeclared scripts keep the old behaviour: run after the previous one
+            after = [script_names[idx - 1]] if idx > 0 else []
+            stages[name] = Stage(name=name, after=after)
+        else:
+            stages[name] = Stage(
+                name=name,
+                after=list(spec.get("after", [])),
+                inputs=list(spec.get("inputs", [])),
+                outputs=list(spec.get("outputs", [])),
+                volatile=list(spec.get("volatile", [])),
+                env=list(spec.get("env", [])),
+            )
+
+    producers = {out: st.name for st in stages.values() for out in st.outputs}
+    for st in stages.values():
+        deps = []
+        for d in st.after + [producers.get(i) for i in st.inputs]:
+            if d is None or d == st.name or d in deps:
+                continue
+            if d not in stages:
+                logger.warning(f"Stage {st.name}: dependency {d} is not scheduled this cycle; ignoring")
+                continue
+            deps.append(d)
+        st.deps = deps
+
+    # Reject cycles up front rather than deadlocking the scheduler
+    visiting, done = set(), set()
+    def visit(n: str, path: List[str]):
+        if n in done:
+            return
+        if n in visiting:
+            raise ValueError(f"Stage dependency cycle: {' -> '.join(path + [n])}")
+        visiting.add(n)
+        for d in stages[n].deps:
+            visit(d, path + [n])
+        visiting.discard(n)
+        done.add(n)
+    for n in stages:
+        visit(n, [])
+    return stages
+
+_compression = None
+def load_compression():
+    """The scripts' compression module, or None if SCRIPTS_DIR has none.
+
+    Loaded by path under a private name so SCRIPTS_DIR never goes on
+    sys.path (its app/loader modules would shadow others in the worker).
+    """
+    global _compression
+    if _compression is None:
+        _compression = False
+        path = SCRIPTS_DIR / "compression.py"
+        if path.exists():
+            spec = importlib.util.spec_from_file_location("_runner_compression", path)
+            module = importlib.util.module_from_spec(spec)
+            try:
+                spec.loader.exec_module(module)
+                _compression = module
+            except Exception:
+                pass
+    return _compression or None
+
+def resolve_stage_path(rel: str) -> Path:
+    # Stages may write compressed variants (OUTPUT_COMPRESSION)
+    compression = load_compression()
+    return compression.resolve_input(FILES_DIR / rel) if compression else FILES_DIR / rel
+
+def _hash_content(h, rel: str, volatile: List[str]):
+    p = resolve_stage_path(rel)
+    compression = load_compression()
+    open_input = compression.open_input if compression else open
+    if volatile and rel.endswith(".csv"):
+        # Hash decoded rows so volatile columns (and the codec) don't count
+        with open_input(p, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            headers = next(reader, [])
+            keep = [i for i, col in enumerate(headers) if col not in volatile]
+            h.update("\x1f".join(headers[i] for i in keep).encode("utf-8") + b"\n")
+            for row in reader:
+                h.update("\x1f".join(row[i] if i < len(row) else "" for i in keep).encode("utf-8") + b"\n")
+    elif volatile and rel.endswith(".json"):
+        with open_input(p, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            for key in volatile:
+                data.pop(key, None)
+        h.update(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    else:
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+
+def hash_inputs(stage: Stage) -> str:
+    """Skip key for a stage: its inputs, the scripts' code and its env config."""
+    h = hashlib.sha256()
+    # The stage may import any shared module, so all of the scripts count
+    for p in sorted(SCRIPTS_DIR.glob("*.py")):
+        h.update(p.name.encode("utf-8") + b"\0" + p.read_bytes() + b"\0")
+    for key in sorted(k for k in os.environ if any(fnmatch.fnmatchcase(k, pat) for pat in stage.env)):
+        h.update(f"{key}={os.environ[key]}".encode("utf-8") + b"\0")
+    for rel in sorted(stage.inputs):
+        h.update(rel.encode("utf-8") + b"\0")
+        try:
+            _hash_content(h, rel, stage.volatile)
+        except FileNotFoundError:
+            h.update(b"<missing>")
+        h.update(b"\0")
+    return h.hexdigest()
+
+def load_stage_state() -> dict:
+    try:
+        return json.loads(STAGE_STATE_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def save_stage_state(state: dict):
+    STAGE_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    compression = load_compression()
+    if compression:
+        compression.write_json_atomic(STAGE_STATE_PATH, state, indent=2)
+    else:
+        STAGE_STATE_PATH.write_text(json.dumps(state, indent=2), encoding="utf-8")
+
+def can_skip(stage: Stage, inputs_hash: str, state: dict) -> bool:
+    if not SKIP_UNCHANGED or not stage.inputs:
+        return False
+    prev = state.get(stage.name) or {}
+    if prev.get("inputs_hash") != inputs_hash:
+        return False
+    return all(resolve_stage_path(o).exists() for o in stage.outputs)
+
+def run_stage_graph(stages: Dict[str, Stage], logger: logging.Logger) -> Dict[str, str]:
+    """Run stages as soon as their dependencies succeed; returns name -> status."""
+    state = load_stage_state()
+    status: Dict[str, str] = {}
+    pending = dict(stages)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL) as pool:
+        while pending or running:
+            progressed = True
+            while progressed:
+                progressed = False
+                for name, st in list(pending.items()):
+                    dep_status = [status.get(d) for d in st.deps]
+                    if any(s in ("failed", "blocked") for s in dep_status):
+                        failed = [d for d in st.deps if status.get(d) in ("failed", "blocked")]
+                        logger.warning(f"Stage {name} blocked: dependency {', '.join(failed)} did not succeed")
+                        status[name] = "blocked"
+                    elif all(s in ("ok", "skipped") for s in dep_status):
+                        inputs_hash = hash_inputs(st)
+                        if can_skip(st, inputs_hash, state):
+                            logger.info(f"Stage {name} skipped: inputs, code and config unchanged")
+                            status[name] = "skipped"
+                        else:
+                            logger.info(f"--- Running {name} (deps: {st.deps or '-'}) ---")
+                            fut = pool.submit(run_script, SCRIPTS_DIR / name, logger)
+                            running[fut] = (name, inputs_hash)
+                    else:
+                        continue
+                    del pending[name]
+                    progressed = True
+
+            if not running:
+                break
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name, inputs_hash = running.pop(fut)
+                try:
+                    rc = fut.result()
+                except Exception as e:
+                    logger.error(f"Stage {name} crashed: {e}")
+                    rc = -1
+                if rc == 0:
+                    status[name] = "ok"
+                    state[name] = {
+                        "inputs_hash": inputs_hash,
+                        "finished_at": datetime.now(timezone.utc).isoformat(),
+                    }
+                else:
+                    logger.warning(f"Script {name} exited with rc={rc}")
+                    status[name] = "failed"
+                    state.pop(name, None)
+
+    try:
+        save_stage_state(state)
+    except Exception as e:
+        logger.warning(f"Failed to save stage state: {e}")
+    return status
+
 # ---------- Public entry: run ONE cycle ----------
 def run_one_cycle():
     logger = get_logger()
@@ -223,12 +493,16 @@ def run_one_cycle():
 
     housekeeping(logger)
 
-    for idx, name in enumerate(script_names):
-        script_path = SCRIPTS_DIR / name
-        logger.info(f"--- [{idx}] Running {name} ---")
-        rc = run_script(script_path, logger)
-        if rc != 0:
-            logger.warning(f"Script {name} exited with rc={rc}")
+    try:
+        stages = build_stages(script_names, load_stage_graph(), logger)
+    except Exception as e:
+        logger.error(f"Invalid stage graph: {e}")
+        return
+    for st in stages.values():
+        logger.info(f"Stage {st.name}: deps={st.deps}")
+
+    status = run_stage_graph(stages, logger)
+    logger.info("Stage results: " + ", ".join(f"{n}={status.get(n, '?')}" for n in script_names))
 
     cycle_dur = (datetime.now(timezone.utc) - cycle_start).total_seconds()
     logger.info(f"Cycle finished in {cycle_dur:.1f}s")
@@ -0,0 +1,142 @@
+"""Minimal local stand-in for the Salesforce describe and Bulk API 2.0 ingest endpoints.
+
+It only covers what loader.py uses. Jobs complete as soon as their upload
+is marked UploadComplete. A row is rejected when its column set breaks the
+describe metadata: a field that is not createable (insert) or not
+updateable (update). A row is also rejected when its key is listed in
+`fail_once` (first attempt only) or `fail_always`.
+"""
+import csv
+import io
+import itertools
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class BulkStandIn:
+    def __init__(self, describe):
+        # describe: {sobject: {field: (createable, updateable)}}
+        self.describe = describe
+        self.records = {}           # (sobject, key) -> row dict
+        self.jobs = {}              # job id -> job dict
+        self.fail_once = set()      # (sobject, key)
+        self.fail_always = set()    # (sobject, key)
+        self.fail_upload = False    # PUT .../batches returns 500
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def jobs_for(self, sobject):
+        return [j for j in self.jobs.values() if j["object"] == sobject]
+
+    def _process(self, job):
+        sobject, ext_id = job["object"], job["externalIdFieldName"]
+        meta = self.describe[sobject]
+        reader = csv.DictReader(io.StringIO(job["data"].decode("utf-8")))
+        job["header"] = list(reader.fieldnames or [])
+        job["rows"], job["failed"] = [], []
+        for row in reader:
+            job["rows"].append(row)
+            key = (sobject, row[ext_id])
+            exists = key in self.records
+            bad = [f for f in job["header"]
+                   if f != ext_id and not meta.get(f, (False, False))[1 if exists else 0]]
+            if ext_id == "Id" and not exists:
+                error = "INVALID_CROSS_REFERENCE_KEY:invalid cross reference id"
+            elif bad:
+                error = f"INVALID_FIELD_FOR_INSERT_UPDATE:Unable to create/update fields: {', '.join(bad)}"
+            elif key in self.fail_always:
+                error = "FIELD_INTEGRITY_EXCEPTION:rejected"
+            elif key in self.fail_once:
+                self.fail_once.discard(key)
+                error = "UNABLE_TO_LOCK_ROW:unable to obtain exclusive access to this record"
+            else:
+                self.records[key] = dict(self.records.get(key, {}), **row)
+                continue
+            job["failed"].append(dict(row, sf__Id="", sf__Error=error))
+        job["state"] = "JobComplete"
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code, body=b"", ctype="application/json"):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self):
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_GET(self):
+                m = re.search(r"/sobjects/(\w+)/describe/?$", self.path)
+                if m:
+                    fields = [{"name": n, "createable": c, "updateable": u}
+                              for n, (c, u) in standin.describe[m.group(1)].items()]
+                    return self._send(200, {"name": m.group(1), "fields": fields})
+                m = re.search(r"/jobs/ingest/(\w+)/failedResults/?$", self.path)
+                if m:
+                    job = standin.jobs[m.group(1)]
+                    buf = io.StringIO()
+                    cols = ["sf__Id", "sf__Error"] + job["header"]
+                    w = csv.DictWriter(buf, fieldnames=cols, lineterminator="\n")
+                    w.writeheader()
+                    w.writerows(job["failed"])
+                    return self._send(200, buf.getvalue().encode("utf-8"), "text/csv")
+                job = standin.jobs[self.path.rstrip("/").rsplit("/", 1)[-1]]
+                return self._send(200, {
+                    "id": job["id"],
+                    "state": job["state"],
+                    "numberRecordsProcessed": len(job.get("rows", [])),
+                    "numberRecordsFailed": len(job.get("failed", [])),
+                })
+
+            def do_POST(self):
+                spec = json.loads(self._body())
+                with standin._lock:
+                    job_id = f"750{next(standin._ids):015d}"
+                    standin.jobs[job_id] = dict(spec, id=job_id, state="Open", data=b"")
+                self._send(200, {"id": job_id, "state": "Open"})
+
+            def do_PUT(self):
+                job_id = self.path.rstrip("/").split("/")[-2]
+                body = self._body()
+                if standin.fail_upload:
+                    return self._send(500, {"message": "stand-in upload failure"})
+                standin.jobs[job_id]["data"] = body
+                self._send(201)
+
+            def do_PATCH(self):
+                job_id = self.path.rstrip("/").rsplit("/", 1)[-1]
+                state = json.loads(self._body())["state"]
+                job = standin.jobs[job_id]
+                with standin._lock:
+                    if state == "UploadComplete":
+                        standin._process(job)
+                    else:
+                        job["state"] = state
+                self._send(200, {"id": job_id, "state": job["state"]})
+
+        return Handler
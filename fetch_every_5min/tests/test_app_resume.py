@@ -0,0 +1,143 @@
+import csv
+import json
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "files" / "scripts"))
+
+import app  # noqa: E402
+import compression  # noqa: E402
+
+PAGE_SIZE = 3
+
+RECORDS = [
+    {
+        "Id": f"01u{i:05d}", "Pricebook2Id": f"01sPB{i % 2}", "Product2Id": f"01tP{i}",
+        "UnitPrice": 10.0 + i, "IsActive": True, "UseStandardPrice": False,
+        "CreatedDate": "2024-01-01T00:00:00.000+0000", "LastModifiedDate": "2024-01-02T00:00:00.000+0000",
+        "X_discount__c": i % 3, "CurrencyIsoCode": "EUR",
+        "Pricebook2": {"Id": f"01sPB{i % 2}", "Name": f"Book {i % 2}", "IsActive": True, "IsStandard": i % 2 == 0},
+        "Product2": {"Name": f"Product \"{i}\"", "ProductCode": str(4300 + i), "Family": "Hardware",
+                     "IsActive": True, "Description": "line1\nline2", "Term__c": "12"},
+    }
+    for i in range(11)
+]
+
+class FakeSObject:
+    def __init__(self, fields):
+        self.fields = fields
+        self.api_usage = {}
+
+    def describe(self):
+        return {"fields": [{"name": f} for f in self.fields]}
+
+class FakeSalesforce:
+    """query/query_more over RECORDS in pages of PAGE_SIZE, honouring `Id > '...'`."""
+
+    def __init__(self, fail_after_pages=None):
+        self.fail_after_pages = fail_after_pages
+        self.queries = []
+        self.pages = 0
+        self.api_usage = {"api-usage": SimpleNamespace(used=10, total=100)}
+        self.PricebookEntry = FakeSObject(["X_discount__c"])
+        self.Product2 = FakeSObject(["Term__c"])
+
+    def query_all(self, soql):
+        return {"records": [{"Id": "01sPB0", "Name": "Book 0", "IsStandard": True},
+                            {"Id": "01sPB1", "Name": "Book 1", "IsStandard": False}]}
+
+    def query(self, soql):
+        self.queries.append(soql)
+        if "LIMIT 1" in soql:
+            return {"records": []}
+        after = soql.split("Id > '")[1].split("'")[0] if "Id > '" in soql else ""
+        self._rest = [r for r in RECORDS if r["Id"] > after]
+        return self._page()
+
+    def query_more(self, url, identifier_is_url=False):
+        if self.fail_after_pages is not None and self.pages >= self.fail_after_pages:
+            raise RuntimeError("connection dropped mid-export")
+        return self._page()
+
+    def _page(self):
+        self.pages += 1
+        page, self._rest = self._rest[:PAGE_SIZE], self._rest[PAGE_SIZE:]
+        return {"records": page, "done": not self._rest, "nextRecordsUrl": "/next"}
+
+@pytest.fixture
+def export_dirs(tmp_path, monkeypatch):
+    state = tmp_path / "state"
+    state.mkdir()
+    monkeypatch.setattr(app, "CHECKPOINT_PATH", state / "app_checkpoint.json")
+    monkeypatch.setattr(app, "SPOOL_PATH", state / "app_entries.spool.jsonl")
+    monkeypatch.setattr(app, "METADATA_CACHE_PATH", state / "app_metadata_cache.json")
+    monkeypatch.setattr(app, "CHECKPOINT_ENABLED", True)
+    monkeypatch.setattr(compression, "COMPRESSION_BLOCK_BYTES", 256)
+
+    def run(out_dir, sf):
+        out_dir.mkdir(exist_ok=True)
+        monkeypatch.setattr(app, "OUT_DIR", out_dir)
+        monkeypatch.setattr(app, "login_salesforce", lambda: sf)
+        app.main()
+
+    return tmp_path, state, run
+
+def read_outputs(out_dir):
+    outputs = {}
+    for name in ("pricebooks_export.csv", "pricebooks_export.tsv", "pricebooks_export.json"):
+        with compression.open_input(out_dir / name, newline="", encoding="utf-8") as f:
+            outputs[name] = f.read()
+    data = json.loads(outputs["pricebooks_export.json"])
+    data.pop("exported_at")
+    outputs["pricebooks_export.json"] = data
+    return outputs
+
+@pytest.mark.parametrize("codec", ["none", "gzip"])
+def test_resumed_export_matches_clean_run(export_dirs, monkeypatch, codec):
+    tmp_path, state, run = export_dirs
+    monkeypatch.setattr(compression, "OUTPUT_COMPRESSION", codec)
+
+    run(tmp_path / "clean", FakeSalesforce())
+    clean = read_outputs(tmp_path / "clean")
+    assert clean["pricebooks_export.csv"].startswith("﻿")
+    assert clean["pricebooks_export.csv"].count("﻿") == 1
+    assert clean["pricebooks_export.json"]["total_entry_count"] == len(RECORDS)
+
+    # Fail on the third page, after two pages were checkpointed
+    with pytest.raises(RuntimeError):
+        run(tmp_path / "resumed", FakeSalesforce(fail_after_pages=2))
+    ckpt = json.loads((state / "app_checkpoint.json").read_text(encoding="utf-8"))
+    assert ckpt["last_id"] == RECORDS[2 * PAGE_SIZE - 1]["Id"]
+
+    sf = FakeSalesforce()
+    run(tmp_path / "resumed", sf)
+    entry_queries = [q for q in sf.queries if "FROM PricebookEntry" in q and "LIMIT 1" not in q]
+    assert entry_queries == [q for q in entry_queries if f"Id > '{ckpt['last_id']}'" in q]
+    assert read_outputs(tmp_path / "resumed") == clean
+    assert not (state / "app_checkpoint.json").exists()
+    suffix = compression.SUFFIXES[codec]
+    assert not list((tmp_path / "resumed").glob("*.part"))
+    assert (tmp_path / "resumed" / f"pricebooks_export.csv{suffix}").exists()
+
+def test_checkpoint_from_other_header_starts_over(export_dirs, monkeypatch):
+    tmp_path, state, run = export_dirs
+    monkeypatch.setattr(compression, "OUTPUT_COMPRESSION", "none")
+
+    with pytest.raises(RuntimeError):
+        run(tmp_path / "out", FakeSalesforce(fail_after_pages=2))
+
+    # Same checkpointed metadata (so the same SOQL) but a different header
+    monkeypatch.setattr(app, "INCLUDE_PRODUCT2_CUSTOM_FIELDS", False)
+    sf = FakeSalesforce()
+    run(tmp_path / "out", sf)
+    assert not any("Id > '" in q for q in sf.queries)
+    assert not any("Product2.Term__c" in q for q in sf.queries)
+
+    with (tmp_path / "out" / "pricebooks_export.tsv").open(newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f, delimiter="\t"))
+    assert "Product.Term__c" not in rows[0]
+    assert len(rows) == len(RECORDS) + 1
+    assert {len(row) for row in rows} == {len(rows[0])}
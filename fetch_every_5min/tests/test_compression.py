@@ -0,0 +1,123 @@
+import gzip
+import os
+import sys
+import time
+import zlib
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "files" / "scripts"))
+
+import compression  # noqa: E402
+
+CODECS = [
+    "gzip",
+    pytest.param("zstd", marks=pytest.mark.skipif(compression.zstandard is None, reason="zstandard not installed")),
+]
+
+LINES = [f"{i},\"Product {i}\",{i * 1.5:.2f},é€\n" for i in range(500)]
+
+def count_members(path: Path, codec: str) -> int:
+    data = path.read_bytes()
+    if codec == "zstd":
+        count = 0
+        while data:
+            size = compression.zstandard.frame_header_size(data)
+            assert size > 0
+            count += 1
+            dobj = compression.zstandard.ZstdDecompressor().decompressobj()
+            dobj.decompress(data)
+            data = dobj.unused_data
+        return count
+    count = 0
+    while data:
+        dobj = zlib.decompressobj(wbits=31)
+        dobj.decompress(data)
+        assert dobj.eof
+        count += 1
+        data = dobj.unused_data
+    return count
+
+def read_text(path: Path, encoding="utf-8") -> str:
+    with compression.open_input(path, newline="", encoding=encoding) as f:
+        return f.read()
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(compression, "COMPRESSION_BLOCK_BYTES", 1024)
+    monkeypatch.setattr(compression, "COMPRESSION_THREADS", 3)
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_round_trip_writes_several_blocks(tmp_path, codec):
+    path = compression.compressed_path(tmp_path / "out.csv", codec)
+    assert path.name == "out.csv" + compression.SUFFIXES[codec]
+    with compression.open_output(path, "w", newline="", codec=codec) as f:
+        f.writelines(LINES)
+
+    expected = "".join(LINES)
+    assert len(expected.encode("utf-8")) > 10 * 1024
+    assert count_members(path, codec) >= 10
+    assert read_text(path) == expected
+    if codec == "gzip":
+        # Any standard reader sees a single stream
+        assert gzip.decompress(path.read_bytes()).decode("utf-8") == expected
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_flush_then_tell_is_a_truncation_point(tmp_path, codec):
+    path = tmp_path / ("out.csv" + compression.SUFFIXES[codec])
+    with compression.open_output(path, "w", encoding="utf-8-sig", newline="", codec=codec) as f:
+        f.writelines(LINES[:200])
+        f.flush()
+        checkpoint = f.buffer.tell()
+        # Written after the checkpoint, then lost
+        f.writelines(LINES[200:300])
+        f.flush()
+    assert path.stat().st_size > checkpoint
+
+    # Resume: cut back to the checkpoint and append the rest
+    os.truncate(path, checkpoint)
+    with compression.open_output(path, "a", encoding="utf-8-sig", newline="", codec=codec) as f:
+        f.writelines(LINES[200:])
+
+    text = read_text(path, encoding="utf-8")
+    assert text.count("﻿") == 1
+    assert text == "﻿" + "".join(LINES)
+
+@pytest.mark.parametrize("codec", ["none"] + CODECS)
+def test_append_with_bom_writes_single_bom(tmp_path, codec):
+    path = tmp_path / ("out.csv" + compression.SUFFIXES[codec])
+    for chunk in (LINES[:10], LINES[10:20], LINES[20:30]):
+        mode = "a" if path.exists() else "w"
+        with compression.open_output(path, mode, encoding="utf-8-sig", newline="", codec=codec) as f:
+            f.writelines(chunk)
+    text = read_text(path, encoding="utf-8")
+    assert text.count("﻿") == 1
+    assert text == "﻿" + "".join(LINES[:30])
+
+def test_open_output_removes_other_variants(tmp_path):
+    plain = tmp_path / "out.csv"
+    plain.write_text("old", encoding="utf-8")
+    (tmp_path / "out.csv.zst").write_bytes(b"old")
+
+    with compression.open_output(tmp_path / "out.csv.gz", "w", codec="gzip") as f:
+        f.write("new")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["out.csv.gz"]
+    assert compression.resolve_input(plain) == tmp_path / "out.csv.gz"
+    assert read_text(plain) == "new"
+
+def test_resolve_input_picks_existing_or_newest_variant(tmp_path):
+    plain = tmp_path / "out.csv"
+    assert compression.resolve_input(plain) == plain
+
+    gz = tmp_path / "out.csv.gz"
+    gz.write_bytes(gzip.compress(b"gz"))
+    assert compression.resolve_input(plain) == gz
+    assert compression.resolve_input(tmp_path / "out.csv.zst") == gz
+
+    plain.write_text("plain", encoding="utf-8")
+    now = time.time()
+    os.utime(gz, (now - 60, now - 60))
+    os.utime(plain, (now, now))
+    assert compression.resolve_input(gz) == plain
+    assert read_text(gz) == "plain"
@@ -0,0 +1,157 @@
+import csv
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "files" / "scripts"))
+
+import compression  # noqa: E402
+import loader  # noqa: E402
+from bulk_standin import BulkStandIn  # noqa: E402
+
+# field: (createable, updateable)
+DESCRIBE = {
+    "Pricebook2": {
+        "Name": (True, True), "Description": (True, True), "IsActive": (True, True),
+        "IsStandard": (False, False), "CreatedDate": (False, False), "SystemModstamp": (False, False),
+    },
+    "Product2": {
+        "Name": (True, True), "ProductCode": (True, True), "IsActive": (True, True),
+        "CASESAFE__c": (False, False), "CreatedDate": (False, False), "SystemModstamp": (False, False),
+    },
+    "PricebookEntry": {
+        "Pricebook2Id": (True, False), "Product2Id": (True, False),
+        "UnitPrice": (True, True), "IsActive": (True, True),
+        "Name": (False, False), "ProductCode": (False, False), "SystemModstamp": (False, False),
+    },
+}
+
+PRICEBOOKS = [
+    {"Id": "01sSTD", "Name": "Standard", "Description": "", "IsActive": "True", "IsStandard": "True",
+     "CreatedDate": "2020-01-01", "SystemModstamp": "t1"},
+    {"Id": "01sPB1", "Name": "Trade", "Description": "", "IsActive": "True", "IsStandard": "False",
+     "CreatedDate": "2020-01-01", "SystemModstamp": "t1"},
+]
+PRODUCTS = [
+    {"Id": f"01tP{i}", "Name": f"Product {i}", "ProductCode": str(4300 + i), "IsActive": "True",
+     "CASESAFE__c": f"01tP{i}", "CreatedDate": "2020-01-01", "SystemModstamp": "t1"}
+    for i in range(3)
+]
+ENTRIES = [
+    {"Id": f"01uE{i}", "Pricebook2Id": "01sPB1", "Product2Id": f"01tP{i % 3}", "UnitPrice": f"{10 + i}.0",
+     "IsActive": "True", "Name": f"Product {i % 3}", "ProductCode": str(4300 + i % 3), "SystemModstamp": "t1"}
+    for i in range(5)
+]
+
+def _write_csv(path, rows):
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=list(rows[0]))
+        w.writeheader()
+        w.writerows(rows)
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    in_dir = tmp_path / "salesforce"
+    in_dir.mkdir()
+    _write_csv(in_dir / "pricebooks.csv", PRICEBOOKS)
+    _write_csv(in_dir / "products.csv", PRODUCTS)
+    _write_csv(in_dir / "pricebookEntries.csv", ENTRIES)
+
+    state = tmp_path / "state"
+    monkeypatch.setattr(loader, "INPUT_DIR", in_dir)
+    monkeypatch.setattr(loader, "SNAPSHOT_DIR", state / "snapshot")
+    monkeypatch.setattr(loader, "FAILED_DIR", state / "failed")
+    monkeypatch.setattr(loader, "BATCH_MAX_ROWS", 2)
+    monkeypatch.setattr(loader, "POLL_SECONDS", 0)
+    monkeypatch.setattr(compression, "SF_RETRY_ATTEMPTS", 1)
+
+    with BulkStandIn(DESCRIBE) as standin:
+        # Upserting on Id means loading back into the source org, so the
+        # records already exist there
+        for pb in PRICEBOOKS:
+            standin.records[("Pricebook2", pb["Id"])] = {}
+        for p in PRODUCTS:
+            standin.records[("Product2", p["Id"])] = {}
+        for e in ENTRIES:
+            standin.records[("PricebookEntry", e["Id"])] = {}
+        client = loader.BulkClient(standin.url, "token")
+        yield standin, client, in_dir, state
+
+def _load_all(client):
+    return {spec["sobject"]: loader.load_object(client, spec) for spec in loader.OBJECTS}
+
+def test_batches_use_writable_fields(env):
+    standin, client, _, _ = env
+    assert _load_all(client) == {"Pricebook2": (1, 0), "Product2": (3, 0), "PricebookEntry": (5, 0)}
+
+    entry_jobs = standin.jobs_for("PricebookEntry")
+    # Batches run concurrently, so jobs may be created in any order
+    assert sorted(len(j["rows"]) for j in entry_jobs) == [1, 2, 2]
+    # Create-only references and read-only columns are not sent on update
+    assert {tuple(j["header"]) for j in entry_jobs} == {("Id", "UnitPrice", "IsActive")}
+    assert "CASESAFE__c" not in standin.jobs_for("Product2")[0]["header"]
+    # The standard price book is never sent
+    assert [r["Id"] for j in standin.jobs_for("Pricebook2") for r in j["rows"]] == ["01sPB1"]
+
+def test_failed_rows_are_retried_then_recorded(env):
+    standin, client, _, state = env
+    standin.fail_once.add(("PricebookEntry", "01uE1"))
+    standin.fail_always.add(("PricebookEntry", "01uE3"))
+
+    _, failed = loader.load_object(client, loader.OBJECTS[2])
+    assert failed == 1
+    assert standin.records[("PricebookEntry", "01uE1")]["UnitPrice"] == "11.0"
+    retry_job = standin.jobs_for("PricebookEntry")[-1]
+    assert sorted(r["Id"] for r in retry_job["rows"]) == ["01uE1", "01uE3"]
+
+    with (state / "failed" / "PricebookEntry.csv").open(newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [r["Id"] for r in rows] == ["01uE3"]
+    assert rows[0]["sf__Error"].startswith("FIELD_INTEGRITY_EXCEPTION")
+
+    # The failed row is not in the snapshot, so the next run sends it again
+    standin.fail_always.clear()
+    before = len(standin.jobs)
+    assert loader.load_object(client, loader.OBJECTS[2]) == (5, 0)
+    sent = [r["Id"] for j in list(standin.jobs.values())[before:] for r in j["rows"]]
+    assert sent == ["01uE3"]
+    assert not (state / "failed" / "PricebookEntry.csv").exists()
+
+def test_only_changed_rows_are_sent(env):
+    standin, client, in_dir, _ = env
+    _load_all(client)
+    before = len(standin.jobs)
+
+    # SystemModstamp changes every cycle but is not a loaded field
+    entries = [dict(e, SystemModstamp="t2") for e in ENTRIES]
+    entries[4]["UnitPrice"] = "99.0"
+    _write_csv(in_dir / "pricebookEntries.csv", entries)
+
+    _load_all(client)
+    new_jobs = list(standin.jobs.values())[before:]
+    assert [(j["object"], [r["Id"] for r in j["rows"]]) for j in new_jobs] == [("PricebookEntry", ["01uE4"])]
+    assert standin.records[("PricebookEntry", "01uE4")]["UnitPrice"] == "99.0"
+
+def test_new_rows_send_create_fields(env, monkeypatch):
+    standin, client, _, _ = env
+    monkeypatch.setitem(DESCRIBE["PricebookEntry"], "External_Key__c", (True, True))
+    monkeypatch.setattr(loader, "external_id_field", lambda sobject: "External_Key__c")
+    entries = [dict(e, External_Key__c=f"K{i}") for i, e in enumerate(ENTRIES)]
+    _write_csv(loader.INPUT_DIR / "pricebookEntries.csv", entries)
+
+    assert loader.load_object(client, loader.OBJECTS[2]) == (5, 0)
+    assert "Pricebook2Id" in standin.jobs_for("PricebookEntry")[0]["header"]
+
+    entries[0]["UnitPrice"] = "1.0"
+    _write_csv(loader.INPUT_DIR / "pricebookEntries.csv", entries)
+    assert loader.load_object(client, loader.OBJECTS[2]) == (5, 0)
+    update_job = standin.jobs_for("PricebookEntry")[-1]
+    assert update_job["header"] == ["External_Key__c", "UnitPrice", "IsActive"]
+
+def test_failed_upload_aborts_job(env):
+    standin, client, _, _ = env
+    standin.fail_upload = True
+    _, failed = loader.load_object(client, loader.OBJECTS[2])
+    assert failed == 5
+    assert {j["state"] for j in standin.jobs_for("PricebookEntry")} == {"Aborted"}
@@ -0,0 +1,94 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "files" / "scripts"))
+
+import price_history  # noqa: E402
+
+T0 = price_history.to_epoch("2025-09-09T10:00:00Z")
+T1 = T0 + 300
+T2 = T1 + 300
+T3 = T2 + 300
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(price_history, "TRACKED_FIELDS", ["UnitPrice", "IsActive"])
+    conn = price_history.connect(tmp_path / "history.sqlite3")
+    yield conn
+    conn.close()
+
+def entry(entry_id, price, pricebook="01sPB1", active=True):
+    return {"Id": entry_id, "Pricebook2Id": pricebook, "UnitPrice": price, "IsActive": active}
+
+def count_changes(conn):
+    return conn.execute("SELECT COUNT(*) FROM changes").fetchone()[0]
+
+def test_only_changes_are_appended(conn):
+    # UnitPrice, IsActive and _present for each new entry
+    assert price_history.record_snapshot(conn, [entry("E1", 10.0), entry("E2", 20.0)], T0) == 6
+    assert price_history.record_snapshot(conn, [entry("E1", 10.0), entry("E2", 20.0)], T1) == 0
+    assert price_history.record_snapshot(conn, [entry("E1", 11.0), entry("E2", 20.0)], T2) == 1
+    assert count_changes(conn) == 7
+
+    assert price_history.value_at(conn, "E1", T1) == "10.0"
+    assert price_history.value_at(conn, "E1", T2) == "11.0"
+    assert price_history.value_at(conn, "E1", T2 - 1) == "10.0"
+    assert price_history.value_at(conn, "E2", T2, "IsActive") == "True"
+
+def test_unknown_entry_and_time_before_history(conn):
+    price_history.record_snapshot(conn, [entry("E1", 10.0)], T1)
+    assert price_history.value_at(conn, "E1", T0) is None
+    assert price_history.value_at(conn, "E9", T1) is None
+
+def test_removed_entry_reads_as_absent_until_it_reappears(conn):
+    price_history.record_snapshot(conn, [entry("E1", 10.0), entry("E2", 20.0)], T0)
+    assert price_history.record_snapshot(conn, [entry("E1", 10.0)], T1) == 1
+    assert price_history.value_at(conn, "E2", T1 - 1) == "20.0"
+    assert price_history.value_at(conn, "E2", T1) is None
+    # Still absent: nothing new to record
+    assert price_history.record_snapshot(conn, [entry("E1", 10.0)], T2) == 0
+
+    # Back with the same price: only _present changes
+    assert price_history.record_snapshot(conn, [entry("E1", 10.0), entry("E2", 20.0)], T3) == 1
+    assert price_history.value_at(conn, "E2", T3) == "20.0"
+    assert price_history.value_at(conn, "E2", T2) is None
+
+def test_filtered_export_leaves_other_pricebooks_alone(conn):
+    price_history.record_snapshot(conn, [entry("E1", 10.0, "01sPB1"), entry("E2", 20.0, "01sPB2")], T0)
+
+    # Export filtered to 01sPB1 in which E1 is gone: E2 is not marked absent
+    assert price_history.record_snapshot(conn, [], T1, pricebook_filter="01sPB1") == 1
+    assert price_history.value_at(conn, "E1", T1) is None
+    assert price_history.value_at(conn, "E2", T1) == "20.0"
+
+def test_snapshot_not_newer_than_history_is_rejected(conn):
+    price_history.record_snapshot(conn, [entry("E1", 10.0)], T1)
+    before = count_changes(conn)
+
+    with pytest.raises(ValueError):
+        price_history.record_snapshot(conn, [entry("E1", 9.0)], T0)
+    # Same time recorded again with different content
+    with pytest.raises(ValueError):
+        price_history.record_snapshot(conn, [entry("E1", 12.0)], T1)
+    assert count_changes(conn) == before
+    assert price_history.value_at(conn, "E1", T3) == "10.0"
+
+    # Recording the same export again is a no-op, not an error
+    assert price_history.record_snapshot(conn, [entry("E1", 10.0)], T1) == 0
+    assert price_history.record_snapshot(conn, [entry("E1", 12.0)], T2) == 1
+
+def test_changes_since_is_exclusive_and_per_pricebook(conn):
+    price_history.record_snapshot(conn, [entry("E1", 10.0, "01sPB1"), entry("E2", 20.0, "01sPB2")], T0)
+    price_history.record_snapshot(conn, [entry("E1", 11.0, "01sPB1"), entry("E2", 21.0, "01sPB2")], T1)
+    price_history.record_snapshot(conn, [entry("E2", 21.0, "01sPB2")], T2, pricebook_filter="01sPB1")
+
+    since_t0 = price_history.changes_since(conn, "01sPB1", T0)
+    assert [(c["ts"], c["entry_id"], c["field"], c["value"]) for c in since_t0] == [
+        (price_history.from_epoch(T1), "E1", "UnitPrice", "11.0"),
+        (price_history.from_epoch(T2), "E1", "_present", "0"),
+    ]
+    assert len(price_history.changes_since(conn, "01sPB1", T0 - 1)) == 3 + 2
+    assert price_history.changes_since(conn, "01sPB1", T2) == []
+    assert [c["entry_id"] for c in price_history.changes_since(conn, "01sPB2", T0)] == ["E2"]